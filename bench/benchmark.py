@@ -0,0 +1,319 @@
+"""Times each stage of making a deck registration sheet, to compare the site between commits
+
+Decks come from the real-world lists in bench/corpus and from synthetic lists generated with a
+fixed seed. Every run builds its own cards.db holding the corpus cards and synthetic filler,
+so results don't depend on the local database, and the card API is replaced by a local stub
+that answers from the same cards without touching the network.
+
+Stages are timed per deck:
+    parse           parse_decklist on the decklist text
+    resolve_cold    CardResolver.resolve_many with a new database connection and no card cache
+    resolve_warm    the same with the connection already open
+    resolve_cached  the same with every card already in the card cache
+    legalities      Decklist.get_legalities on a resolved deck
+    write           Decklist.write on a resolved deck
+    request         POST /generate_decklist through the Flask test client, pdf cache cleared
+    request_repeat  the same request again, served from the pdf cache
+
+Results are printed and saved as JSON, --compare prints the change from an earlier result.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).parents[1].resolve()
+CORPUS_PATH = ROOT / "bench" / "corpus"
+RESULTS_PATH = ROOT / "bench" / "results"
+STAGES = ("parse", "resolve_cold", "resolve_warm", "resolve_cached", "legalities", "write",
+          "request", "request_repeat")
+BIRTHDAY = "1998-04-12"
+# terms of the searches CardInfo.lookup_from_api makes, like !name:"Iono" number:185
+QUERY_TERM_PATTERN = re.compile(r'(\S+):(?:"([^"]*)"|(\S+))')
+
+def git_commit():
+    """gets the commit being benchmarked, with a + if the tree has uncommitted changes"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("+" if dirty.strip() else "")
+
+def read_corpus():
+    """reads the real-world decklists, keyed by file name"""
+    return {path.stem: path.read_text(encoding="utf-8")
+            for path in sorted(CORPUS_PATH.glob("*.txt"))}
+
+def synthetic_catalog(generator, filler):
+    """makes up printings of cards, as (name, set code, collector number, supertype)"""
+    supertypes = ["Pokémon"] * 6 + ["Trainer"] * 3 + ["Energy"]
+    catalog = []
+    for index in range(filler):
+        set_code = f"S{index // 200:02}"
+        supertype = generator.choice(supertypes)
+        catalog.append((f"Synthetic {supertype} {index}", set_code, str(index % 200 + 1),
+                        supertype))
+    return catalog
+
+def synthetic_decklist(generator, catalog):
+    """makes up a 60 card list in the Live export format, with some of the mess users paste"""
+    sections = {"Pokémon": [], "Trainer": [], "Energy": []}
+    targets = {"Pokémon": 16, "Trainer": 34, "Energy": 10}
+    for supertype, target in targets.items():
+        choices = [card for card in catalog if card[3] == supertype]
+        remaining = target
+        while remaining:
+            quantity = min(remaining, generator.randint(1, 4))
+            sections[supertype].append((quantity, generator.choice(choices)))
+            remaining -= quantity
+    lines = []
+    for supertype, entries in sections.items():
+        lines.append(f"{supertype}: {sum(quantity for quantity, _ in entries)}")
+        for quantity, (name, set_code, collector_number, _) in entries:
+            if generator.random() < 0.2:
+                collector_number = collector_number.rjust(3, "0")
+            if generator.random() < 0.1:
+                set_code = set_code.lower()
+            lines.append(f"{quantity} {name} {set_code} {collector_number}")
+        lines.append("")
+    return "\n".join(lines)
+
+def corpus_catalog(decklists):
+    """gets the printings the real-world lists use, as they'll be looked up"""
+    # imported here so CARDS_DB is set before card_database reads it
+    # pylint: disable=import-outside-toplevel
+    import decklist_parser as parser
+    from card_info import CardInfo
+    # pylint: enable=import-outside-toplevel
+    catalog = set()
+    for text in decklists:
+        supertype = None
+        for line in text.splitlines():
+            line = line.strip()
+            section = parser.SECTION_PATTERN.match(line)
+            if section:
+                supertype = parser.SECTIONS[section["section"][0].lower()]
+                continue
+            match = parser.CARD_PATTERN.fullmatch(line)
+            if not match:
+                continue
+            name = parser.ENERGY_SYMBOL_PATTERN.sub(
+                lambda symbol: parser.ENERGY_TYPES[symbol[1]], match["name"])
+            card = CardInfo(name=name, set_code=match["set_code"] or match["set_only"],
+                            collector_number=match["collector_number"], quantity=1)
+            catalog.add((card.name, card.set_code, card.collector_number, supertype))
+    return sorted(catalog)
+
+def build_database(path, catalog):
+    """makes a cards.db holding every card in the catalog"""
+    import card_database # pylint: disable=import-outside-toplevel
+    con = card_database.connect(path)
+    card_database.migrate(con)
+    with con:
+        con.executemany("INSERT OR IGNORE INTO cards "
+                        "(name, setCode, collNo, regMark, type, isStandardLegal, "
+                        "isExpandedLegal) VALUES (?, ?, ?, 'G', ?, 1, 1)",
+                        [(name, set_code, collector_number.lstrip("0"), supertype)
+                         for name, set_code, collector_number, supertype in catalog])
+    con.close()
+
+class StubAPI:
+    """stands in for card_api.search, answering from the catalog after a fixed delay"""
+
+    def __init__(self, catalog, latency):
+        self.latency = latency
+        self.calls = 0
+        self.cards = [SimpleNamespace(
+            name=name, number=collector_number.lstrip("0"), supertype=supertype,
+            regulationMark="G", set=SimpleNamespace(ptcgoCode=set_code),
+            legalities=SimpleNamespace(standard="Legal", expanded="Legal"))
+            for name, set_code, collector_number, supertype in catalog]
+        self._lock = threading.Lock()
+
+    def search(self, query):
+        """finds the catalog cards matching every term of the query"""
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        terms = {term[1]: term[2] or term[3] for term in QUERY_TERM_PATTERN.finditer(query)}
+        return [card for card in self.cards
+                if terms.get("!name", card.name) == card.name
+                and terms.get("set.ptcgoCode", card.set.ptcgoCode) == card.set.ptcgoCode
+                and terms.get("number", card.number) == card.number]
+
+def summarize(durations):
+    """gets the throughput and latency percentiles of one stage, in milliseconds"""
+    if len(durations) > 1:
+        percentiles = statistics.quantiles(durations, n=100, method="inclusive")
+    else:
+        percentiles = durations * 99
+    return {"runs": len(durations), "ops_per_second": len(durations) / sum(durations),
+            "mean_ms": statistics.fmean(durations) * 1000,
+            "p50_ms": percentiles[49] * 1000, "p95_ms": percentiles[94] * 1000,
+            "p99_ms": percentiles[98] * 1000}
+
+def timed(function):
+    """runs a function, returns how many seconds it took"""
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+def run(decklists, iterations, stages):
+    """times every stage on every decklist, returns the durations of each stage in seconds"""
+    # pylint: disable=import-outside-toplevel
+    import card_database
+    from card_cache import CARD_CACHE
+    from card_resolver import CardResolver
+    from decklist import Decklist
+    from decklist_parser import parse_decklist
+    from exceptions import DeckError
+    from pdf_cache import PDF_CACHE
+    from wsgi import app
+    # pylint: enable=import-outside-toplevel
+
+    def resolve(text):
+        cards, _ = parse_decklist(text)
+        return lambda: CardResolver().resolve_many(cards)
+
+    def legalities(deck):
+        try:
+            deck.get_legalities()
+        except DeckError:
+            pass
+
+    client = app.test_client()
+    durations = {stage: [] for stage in stages}
+    for _ in range(iterations):
+        for text in decklists:
+            form = {"playerName": "Benchmark Player", "playerId": "1234567",
+                    "playerBirthday": BIRTHDAY, "decklist": text}
+            if "parse" in durations:
+                durations["parse"].append(timed(lambda: parse_decklist(text)))
+            if "resolve_cold" in durations:
+                CARD_CACHE.clear()
+                card_database.close_reader()
+                durations["resolve_cold"].append(timed(resolve(text)))
+            if "resolve_warm" in durations:
+                CARD_CACHE.clear()
+                durations["resolve_warm"].append(timed(resolve(text)))
+            if "resolve_cached" in durations:
+                resolve(text)()
+                durations["resolve_cached"].append(timed(resolve(text)))
+            deck = Decklist(player_name=form["playerName"], player_id=form["playerId"],
+                            birthday=BIRTHDAY, deck=text)
+            if "legalities" in durations:
+                durations["legalities"].append(timed(lambda: legalities(deck)))
+            if "write" in durations:
+                durations["write"].append(timed(deck.write))
+            if "request" in durations or "request_repeat" in durations:
+                PDF_CACHE.clear()
+                elapsed = timed(lambda: client.post("/generate_decklist", data=form))
+                if "request" in durations:
+                    durations["request"].append(elapsed)
+            if "request_repeat" in durations:
+                durations["request_repeat"].append(
+                    timed(lambda: client.post("/generate_decklist", data=form)))
+    return durations
+
+def print_results(results, previous=None):
+    """prints a table of each stage, with the change in p50 from an earlier result"""
+    print(f"{'stage':<16}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          + (f"{'p50 vs ' + previous['commit']:>18}" if previous else ""))
+    for stage, summary in results["stages"].items():
+        line = f"{stage:<16}{summary['ops_per_second']:>10.1f}{summary['p50_ms']:>10.3f}"\
+               f"{summary['p95_ms']:>10.3f}{summary['p99_ms']:>10.3f}"
+        before = previous and previous["stages"].get(stage)
+        if before:
+            change = (summary["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100
+            line += f"{change:>+17.1f}%"
+        print(line)
+
+def main():
+    """builds the fixtures, runs the benchmark and saves the results"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20,
+                        help="times each decklist goes through every stage (default: %(default)s)")
+    parser.add_argument("--synthetic", type=int, default=20,
+                        help="synthetic decklists to add to the corpus (default: %(default)s)")
+    parser.add_argument("--filler", type=int, default=15000,
+                        help="synthetic cards in the database (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=2023, help="seed for synthetic data")
+    parser.add_argument("--missing", type=float, default=0.0,
+                        help="share of synthetic cards left out of the database for the stub "
+                             "API to find, the first time they're seen (default: %(default)s)")
+    parser.add_argument("--api-latency", type=float, default=0.05,
+                        help="seconds the stub API takes to answer (default: %(default)s)")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="answer lookups from the in-memory card snapshot")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES,
+                        help="stages to run (default: all)")
+    parser.add_argument("--output", type=Path,
+                        help="where to save results (default: bench/results/<commit>.json)")
+    parser.add_argument("--compare", type=Path, help="earlier results to compare against")
+    args = parser.parse_args()
+    # the stub's misses are expected, only real problems should show up in the output
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # every module that opens cards.db has to see the fixture, so this goes before imports
+        os.environ["CARDS_DB"] = str(Path(directory) / "cards.db")
+        if args.snapshot:
+            os.environ["CARDS_DB_SNAPSHOT"] = "1"
+        sys.path.insert(0, str(ROOT / "src"))
+        import card_api # pylint: disable=import-outside-toplevel
+
+        generator = random.Random(args.seed)
+        synthetic = synthetic_catalog(generator, args.filler)
+        decklists = list(read_corpus().values())
+        catalog = corpus_catalog(decklists) + synthetic
+        decklists += [synthetic_decklist(generator, synthetic) for _ in range(args.synthetic)]
+        missing = set(generator.sample(synthetic, int(len(synthetic) * args.missing)))
+        build_database(os.environ["CARDS_DB"], [card for card in catalog if card not in missing])
+        stub = StubAPI(catalog, args.api_latency)
+        card_api.search = stub.search
+
+        started = time.perf_counter()
+        durations = run(decklists, args.iterations, args.stages)
+        elapsed = time.perf_counter() - started
+
+    results = {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {"iterations": args.iterations, "decklists": len(decklists),
+                       "synthetic": args.synthetic, "filler": args.filler, "seed": args.seed,
+                       "missing": args.missing, "api_latency": args.api_latency,
+                       "snapshot": args.snapshot},
+        "seconds": elapsed,
+        "api_calls": stub.calls,
+        "stages": {stage: summarize(times) for stage, times in durations.items()},
+    }
+    previous = None
+    if args.compare:
+        previous = json.loads(args.compare.read_text(encoding="utf-8"))
+    print_results(results, previous)
+    output = args.output or RESULTS_PATH / f"{results['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"{stub.calls} stub API calls, saved results to {output}")
+
+if __name__ == "__main__":
+    main()
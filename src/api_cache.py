@@ -0,0 +1,137 @@
+"""Module containing the on-disk cache of card API responses, shared by every worker
+
+Responses are kept by the exact search they answer, including searches that found nothing or
+more than one card, so a restart or another worker doesn't send the same search again.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# an empty path turns the cache off
+API_CACHE_PATH = os.environ.get("CARD_API_CACHE", Path(__file__).parent.resolve() / "api_cache.db")
+# seconds responses that found cards are kept, and responses that found none
+API_CACHE_HIT_SECONDS = float(os.environ.get("CARD_API_CACHE_HIT_SECONDS", 7 * 24 * 60 * 60))
+API_CACHE_MISS_SECONDS = float(os.environ.get("CARD_API_CACHE_MISS_SECONDS", 60 * 60))
+# most responses kept, the least recently used ones are evicted past it
+API_CACHE_MAX_ENTRIES = int(os.environ.get("CARD_API_CACHE_MAX_ENTRIES", 10000))
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS 'responses'("\
+         "'search' TEXT PRIMARY KEY, 'cards' TEXT NOT NULL, "\
+         "'expiresAt' REAL NOT NULL, 'usedAt' REAL NOT NULL);"\
+         "CREATE INDEX IF NOT EXISTS 'responses_used' ON responses (usedAt);"
+
+class ApiCache:
+    """Size-bounded LRU cache of API responses in a sqlite file, with separate TTLs for hits
+    and misses
+
+    Cards are stored as the json-compatible dictionaries the API sent, callers turn them back
+    into objects. Entries past max_entries are evicted a batch at a time, least recently used
+    first, along with anything expired.
+    """
+
+    def __init__(self, path=API_CACHE_PATH, hit_ttl=API_CACHE_HIT_SECONDS,
+                 miss_ttl=API_CACHE_MISS_SECONDS, max_entries=API_CACHE_MAX_ENTRIES):
+        self.path = Path(path) if path else None
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """whether responses are cached at all"""
+        return self.path is not None and self.max_entries > 0
+
+    def _connect(self):
+        """gets this process' connection, opening it and creating the table on first use"""
+        # connections can't cross a fork, so a worker re-opens anything its parent opened
+        if self._connection is None or self._connection[0] != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            # lets every worker read while another one saves a response
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._connection = (os.getpid(), conn)
+            self._size = None
+        return self._connection[1]
+
+    def get(self, search):
+        """gets the cards a search found, or None if it isn't cached or has expired"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT cards FROM responses WHERE search = ? AND expiresAt > ?",
+                                   (search, now)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                with conn:
+                    conn.execute("UPDATE responses SET usedAt = ? WHERE search = ?", (now, search))
+        except sqlite3.Error:
+            # the API still answers, just more slowly
+            logging.warning("Couldn't read cached response for '%s'", search, exc_info=True)
+            return None
+        return json.loads(row[0])
+
+    def put(self, search, cards):
+        """caches the cards a search found, evicting entries if the cache is full"""
+        if not self.enabled:
+            return
+        now = time.time()
+        ttl = self.hit_ttl if cards else self.miss_ttl
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO responses "
+                                 "(search, cards, expiresAt, usedAt) VALUES (?, ?, ?, ?)",
+                                 (search, json.dumps(cards), now + ttl, now))
+                    self._evict(conn, now)
+        except sqlite3.Error:
+            logging.warning("Couldn't cache response for '%s'", search, exc_info=True)
+
+    def _evict(self, conn, now):
+        """deletes expired entries and the least recently used ones past max_entries"""
+        # other workers add entries too, so the size is recounted whenever eviction could be due
+        if self._size is None or self._size >= self.max_entries:
+            self._size = conn.execute("SELECT count(*) FROM responses").fetchone()[0]
+        else:
+            self._size += 1
+        if self._size <= self.max_entries:
+            return
+        conn.execute("DELETE FROM responses WHERE expiresAt <= ?", (now,))
+        # evicting a tenth at a time keeps a full cache from evicting on every put
+        conn.execute("DELETE FROM responses WHERE search IN (SELECT search FROM responses "
+                     "ORDER BY usedAt LIMIT max(0, (SELECT count(*) FROM responses) - ?))",
+                     (self.max_entries - self.max_entries // 10,))
+        self._size = conn.execute("SELECT count(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        """deletes every cached response and resets the counters"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            if self.enabled:
+                conn = self._connect()
+                with conn:
+                    conn.execute("DELETE FROM responses")
+                self._size = 0
+
+    def stats(self):
+        """gets this process' hit/miss counters"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+API_CACHE = ApiCache()
@@ -0,0 +1,170 @@
+"""module that hosts the website asynchronously, writing sheets in a pool of processes
+
+This is the same site as wsgi.py for ASGI servers, it needs quart and a server to run it:
+
+    pip install quart hypercorn
+    hypercorn --workers 4 --bind 0.0.0.0:8000 asgi:app
+
+Requests wait on card API lookups without holding a thread, and sheets are written by
+ASGI_RENDER_WORKERS processes per server worker. When ASGI_MAX_PENDING sheet requests are
+already being worked on, more are turned away with a 503 straight away instead of queueing.
+"""
+
+from pathlib import Path
+import asyncio
+import csv
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from quart import Quart, Response, g, jsonify, render_template, request, send_file
+from bulk import process_context, read_rows, stream_zip
+from card_resolver import CardResolver
+from decklist import Decklist
+from decklist_parser import parse_decklist
+from exceptions import DeckError
+from pages import site_context
+from pdf_cache import PDF_CACHE
+from validation import validate_request
+from warmup import WARMUP_ENABLED, warm_renderer, warmup
+import metrics
+
+# processes writing sheets for each server worker
+ASGI_RENDER_WORKERS = int(os.environ.get("ASGI_RENDER_WORKERS", 0)) or os.cpu_count()
+# sheet requests one server worker works on at once before answering 503
+ASGI_MAX_PENDING = int(os.environ.get("ASGI_MAX_PENDING", 64))
+
+app = Quart(__name__)
+_pending = 0
+
+@cache
+def render_executor():
+    """gets this worker's pool of processes writing sheets, started on first use"""
+    # started lazily so a server that forks its workers doesn't share one pool between them,
+    # and never forked from this one while its threads may be holding locks
+    return ProcessPoolExecutor(max_workers=ASGI_RENDER_WORKERS, mp_context=process_context(),
+                               initializer=warm_renderer)
+
+async def iterate_in_thread(iterator):
+    """yields from a blocking iterator without blocking the event loop"""
+    iterator = iter(iterator)
+    while True:
+        item = await asyncio.to_thread(next, iterator, None)
+        if item is None:
+            return
+        yield item
+
+@app.before_serving
+async def warm_worker():
+    """warms up this worker and starts its pool before it takes requests, if WARMUP is set"""
+    if WARMUP_ENABLED:
+        await asyncio.to_thread(warmup)
+        # the pool's processes start when it's first given work
+        await asyncio.get_running_loop().run_in_executor(render_executor(), warm_renderer)
+
+@app.before_request
+async def start_request():
+    """starts timing the request"""
+    g.started = time.perf_counter()
+
+@app.after_request
+async def finish_request(response):
+    """records how long the request took"""
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.started,
+                                    endpoint=request.endpoint or "unknown")
+    return response
+
+@app.route('/favicon.ico')
+async def favicon():
+    """reroutes the favicon to /favicon.ico"""
+
+    favicon_path = Path(__file__).parent.resolve() / 'static' / 'favicons' / 'favicon.ico'
+    return await send_file(favicon_path, mimetype='image/vnd.microsoft.icon')
+
+@app.route('/')
+async def render_site(warnings=None, name=None, player_id=None, birthday=None, decklist=None):
+    """renders the homepage"""
+    return await render_template('site.html', **site_context(app.debug, warnings, name,
+                                                             player_id, birthday, decklist))
+
+@app.route('/generate_decklist', methods=['POST'])
+async def generate_decklist():
+    """generates a decklist with the user's input, turning it away if too many are pending"""
+    global _pending # pylint: disable=global-statement
+    if _pending >= ASGI_MAX_PENDING:
+        metrics.SHEETS_REJECTED.inc()
+        return Response("Too many decklists are being made right now, try again in a moment.",
+                        status=503, mimetype='text/plain', headers={'Retry-After': '1'})
+    _pending += 1
+    metrics.SHEETS_PENDING.set(_pending)
+    try:
+        return await make_decklist(await request.form)
+    finally:
+        _pending -= 1
+        metrics.SHEETS_PENDING.set(_pending)
+
+async def make_decklist(form):
+    """resolves a decklist while awaiting the API, then writes it in the process pool"""
+    player_name = form['playerName']
+    player_id = form['playerId']
+    player_birthday = form['playerBirthday']
+    deck_list = form['decklist']
+    try:
+        with metrics.timed("parse"):
+            cards, line_errors = parse_decklist(deck_list)
+        # the cards resolved here go into the Decklist as they are, so cards that missed the
+        # API deadline aren't looked up again while making it
+        with metrics.timed("resolve"):
+            card_errors = await CardResolver().resolve_many_async(cards)
+        decklist_data = await asyncio.to_thread(Decklist, player_name=player_name,
+                                                player_id=player_id, birthday=player_birthday,
+                                                deck=deck_list,
+                                                resolved=(cards, line_errors, card_errors))
+        # the same list is often submitted again to fix a typo or download it again
+        cache_key = decklist_data.cache_key()
+        decklist_pdf = PDF_CACHE.get(cache_key)
+        if decklist_pdf is None:
+            decklist_pdf = await asyncio.get_running_loop().run_in_executor(
+                render_executor(), Decklist.write, decklist_data)
+            PDF_CACHE.put(cache_key, decklist_pdf)
+        return Response(decklist_pdf, mimetype='application/pdf', headers={
+            'Content-Disposition': 'inline; filename="Deck Registration Sheet.pdf"'})
+    except DeckError as error:
+        return await render_site(warnings=error.messages, name=player_name, player_id=player_id,
+                                 birthday=player_birthday, decklist=deck_list)
+
+@app.route('/generate_decklists', methods=['POST'])
+async def generate_decklists():
+    """generates decklists for every player in an uploaded csv or json file"""
+    players = (await request.files)['players']
+    try:
+        rows = read_rows(players.read(), players.filename or "")
+    except (ValueError, csv.Error) as error:
+        return Response(f"Couldn't read players: {error}", status=400, mimetype='text/plain')
+    merged = (await request.form).get('layout') == 'merged'
+    return Response(iterate_in_thread(stream_zip(rows, merged=merged)),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition':
+                             'attachment; filename="Deck Registration Sheets.zip"'})
+
+@app.route('/api/validate', methods=['POST'])
+async def validate_decklists():
+    """checks a decklist or a list of decklists sent as json, without writing any sheets"""
+    data = await request.get_json(silent=True)
+    if data is None:
+        return jsonify(error="Request body must be JSON"), 400
+    try:
+        return jsonify(await asyncio.to_thread(validate_request, data))
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+
+@app.route('/metrics')
+async def render_metrics():
+    """renders the counters and timings for prometheus to scrape"""
+    metrics.update_cache_stats()
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
+    app.run(debug=True)
@@ -0,0 +1,212 @@
+"""Module that writes deck registration sheets for many players at once"""
+
+import csv
+import io
+import json
+import logging
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import as_completed
+from decklist import Decklist, write_combined, write_sheets
+from exceptions import DeckError
+from warmup import warm_renderer
+
+# same names as the fields of the form on the site
+FIELDS = ("playerName", "playerId", "playerBirthday", "decklist")
+BULK_WORKERS = int(os.environ.get("BULK_WORKERS", 0)) or os.cpu_count()
+# most sheets one process draws in one pass
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", 25))
+# most players one upload to the site can have sheets written for
+BULK_MAX_ROWS = int(os.environ.get("BULK_MAX_ROWS", 2000))
+# how pools' processes are started, forkserver where it's available and spawn elsewhere,
+# forking a server that has threads running could copy a lock one of them holds into a
+# process where nothing will ever release it
+BULK_START_METHOD = os.environ.get("BULK_START_METHOD")
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def process_context():
+    """gets the multiprocessing context every pool of processes writing sheets starts them in"""
+    # only pools need multiprocessing, which is slow to import
+    import multiprocessing # pylint: disable=import-outside-toplevel
+    start_method = BULK_START_METHOD or (
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+    context = multiprocessing.get_context(start_method)
+    if start_method == "forkserver":
+        # each new process is forked from one that has already imported what it needs
+        context.set_forkserver_preload(["bulk"])
+    return context
+
+def bulk_executor(workers=BULK_WORKERS):
+    """gets this process' pool of processes writing sheets, started on first use and kept"""
+    from concurrent.futures import ProcessPoolExecutor # pylint: disable=import-outside-toplevel
+    # keyed by pid too, so a server that forks its workers after using a pool starts its own
+    key = (os.getpid(), workers)
+    with _executors_lock:
+        if key not in _executors:
+            _executors[key] = ProcessPoolExecutor(max_workers=workers,
+                                                  mp_context=process_context(),
+                                                  initializer=warm_renderer)
+        return _executors[key]
+
+def read_rows(data, filename, max_rows=BULK_MAX_ROWS):
+    """reads players from a csv or json file, each row is a dict keyed by FIELDS"""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+    if filename.lower().endswith(".json"):
+        rows = json.loads(data)
+        if not isinstance(rows, list):
+            raise ValueError("JSON must be a list of players")
+        if not all(isinstance(row, dict) for row in rows):
+            raise ValueError("JSON must be a list of players, each an object of their fields")
+    else:
+        rows = list(csv.DictReader(io.StringIO(data)))
+    if max_rows is not None and len(rows) > max_rows:
+        raise ValueError(f"At most {max_rows} players can be uploaded at once")
+    return [{field: str(row.get(field) or "") for field in FIELDS} for row in rows]
+
+def row_errors(row, error):
+    """gets the error messages for a row whose sheet couldn't be made"""
+    if isinstance(error, DeckError):
+        return error.messages
+    # one malformed row shouldn't take the rest of the batch down with it
+    logging.error("Couldn't build sheet for %s", row["playerName"], exc_info=error)
+    return ["Row could not be read, check the birthday and decklist."]
+
+def build_batch(rows, merged=False):
+    """writes a batch of players' sheets in one pass, returns their pdfs and error messages
+
+    The pdfs are keyed by each row's position in the batch, or all in one pdf if merged.
+    """
+    decklists = {}
+    errors = {}
+    for index, row in enumerate(rows):
+        try:
+            decklists[index] = Decklist(player_name=row["playerName"], player_id=row["playerId"],
+                                        birthday=row["playerBirthday"], deck=row["decklist"])
+        except Exception as error: # pylint: disable=broad-exception-caught
+            errors[index] = row_errors(row, error)
+    indexes = list(decklists)
+    pdfs, write_errors = (write_combined if merged else write_sheets)(list(decklists.values()))
+    for position, error in write_errors.items():
+        errors[indexes[position]] = row_errors(rows[indexes[position]], error)
+    if not merged:
+        pdfs = {indexes[position]: pdf for position, pdf in enumerate(pdfs) if pdf is not None}
+    return pdfs, errors
+
+def batches(rows, workers):
+    """splits rows into (start, rows) batches, small enough to keep every process busy"""
+    size = max(1, min(BULK_BATCH_SIZE, -(-len(rows) // workers)))
+    return [(start, rows[start:start + size]) for start in range(0, len(rows), size)]
+
+def run_batches(rows, workers, merged=False):
+    """writes batches of sheets in the pool, yields (start, size, (pdfs, errors)) as they finish"""
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures.process import BrokenProcessPool
+    # pylint: enable=import-outside-toplevel
+    executor = bulk_executor(workers)
+    futures = {}
+    try:
+        for start, batch in batches(rows, workers):
+            futures[executor.submit(build_batch, batch, merged)] = (start, len(batch))
+        for future in as_completed(futures):
+            yield *futures[future], future.result()
+    except BrokenProcessPool:
+        # a process died, the next upload gets a new pool instead of failing the same way
+        with _executors_lock:
+            if _executors.get((os.getpid(), workers)) is executor:
+                del _executors[(os.getpid(), workers)]
+        raise
+    finally:
+        # an upload that was cancelled part way doesn't leave its batches for the next one
+        for future in futures:
+            future.cancel()
+
+def build_sheets(rows, workers=BULK_WORKERS):
+    """writes every player's sheet across processes, yields (index, pdf, errors) as they finish"""
+    for start, size, (pdfs, errors) in run_batches(rows, workers):
+        for index in range(size):
+            yield start + index, pdfs.get(index), errors.get(index, [])
+
+def build_merged(rows, workers=BULK_WORKERS):
+    """writes every player's sheet into one pdf in player order, returns it and the errors"""
+    pdfs = {}
+    errors = {}
+    for start, _, (pdf, batch_errors) in run_batches(rows, workers, merged=True):
+        if pdf is not None:
+            pdfs[start] = pdf
+        errors.update((start + index, messages) for index, messages in batch_errors.items())
+    if len(pdfs) == 1:
+        return next(iter(pdfs.values())), errors
+    return merge_sheets(pdfs), errors
+
+def sheet_name(index, row):
+    """gets the file name for a player's sheet"""
+    player_name = re.sub(r"[^\w\- ]", "", row["playerName"]).strip() or "Player"
+    return f"{index + 1:03} {player_name}.pdf"
+
+def error_report(rows, errors):
+    """makes the json report of every row that failed"""
+    return json.dumps([{"row": index + 1, "playerName": rows[index]["playerName"],
+                        "errors": errors[index]} for index in sorted(errors)], indent=2)
+
+class _ChunkWriter(io.RawIOBase):
+    """write-only stream that hands back what was written to it since it was last emptied"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        """this stream can always be written to"""
+        return True
+
+    def write(self, data):
+        """keeps a chunk of data until the next time the stream is emptied"""
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        """gets how many bytes have been written in total"""
+        return self.position
+
+    def empty(self):
+        """gets and forgets everything written so far"""
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def stream_zip(rows, merged=False, workers=BULK_WORKERS):
+    """yields a zip of every player's sheet, a piece at a time as sheets finish
+
+    The zip holds one pdf per player, or all of them in one pdf if merged, and errors.json.
+    """
+    stream = _ChunkWriter()
+    errors = {}
+    with zipfile.ZipFile(stream, "w") as archive:
+        if merged:
+            pdf, errors = build_merged(rows, workers)
+            archive.writestr("Deck Registration Sheets.pdf", pdf)
+        else:
+            for index, pdf, messages in build_sheets(rows, workers):
+                if messages:
+                    errors[index] = messages
+                else:
+                    archive.writestr(sheet_name(index, rows[index]), pdf)
+                    yield stream.empty()
+        archive.writestr("errors.json", error_report(rows, errors))
+    yield stream.empty()
+
+def merge_sheets(pdfs):
+    """merges pdfs of sheets into one pdf, in the order of their keys"""
+    from pypdf import PdfReader, PdfWriter # pylint: disable=import-outside-toplevel
+    output = PdfWriter()
+    for index in sorted(pdfs):
+        output.append(PdfReader(io.BytesIO(pdfs[index])))
+    with io.BytesIO() as merged_file:
+        output.write(merged_file)
+        return merged_file.getvalue()
@@ -0,0 +1,72 @@
+"""Module that talks to the remote pokemon card API"""
+
+import dataclasses
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache
+from pathlib import Path
+from api_cache import API_CACHE
+import metrics
+
+API_KEY_PATH = Path(__file__).parents[1].resolve() / "res" / "APIkey.txt"
+
+# bounds how many API lookups run at once across every request in this process
+API_WORKERS = int(os.environ.get("CARD_API_WORKERS", 8))
+API_EXECUTOR = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="card-api")
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+@cache
+def configure():
+    """imports and configures the sdk once per process, returns its Card class"""
+    # the sdk pulls in urllib and the email package, so pages that never search don't load it
+    # pylint: disable=import-outside-toplevel
+    from pokemontcgsdk import Card, RestClient, querybuilder
+    # pylint: enable=import-outside-toplevel
+    # points the sdk at another server, like tools/card_api_stub.py for testing offline
+    if os.environ.get("POKEMONTCG_IO_ENDPOINT"):
+        querybuilder.__endpoint__ = os.environ["POKEMONTCG_IO_ENDPOINT"].rstrip("/")
+    try:
+        with open(API_KEY_PATH, encoding="utf-8") as reader:
+            RestClient.configure(reader.read().strip())
+    except OSError:
+        logging.warning("API key not found")
+    return Card
+
+def search(query):
+    """searches the API for cards, threads asking the same thing at once share one request"""
+    with _in_flight_lock:
+        future = _in_flight.get(query)
+        owner = future is None
+        if owner:
+            future = Future()
+            _in_flight[query] = future
+    if not owner:
+        return future.result()
+    try:
+        cards = cached_search(query)
+        future.set_result(cards)
+        return cards
+    except Exception as error:
+        metrics.API_FAILURES.inc()
+        future.set_exception(error)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[query]
+
+def cached_search(query):
+    """searches the API for cards, or gets what the same search found last time"""
+    card_class = configure()
+    cached = API_CACHE.get(query)
+    if cached is not None:
+        from dacite import from_dict # pylint: disable=import-outside-toplevel
+        return [from_dict(card_class, card) for card in cached]
+    metrics.API_CALLS.inc()
+    with metrics.timed("api"):
+        cards = card_class.where(q=query, orderBy='-set.releaseDate')
+    API_CACHE.put(query, [dataclasses.asdict(card) for card in cards])
+    return cards
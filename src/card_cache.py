@@ -0,0 +1,73 @@
+"""Module containing the process-wide cache of resolved pokemon cards"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# stored for cards that couldn't be found, so repeat lookups fail fast until it expires
+NOT_FOUND = object()
+
+class CardCache:
+    """Size-bounded LRU cache of resolved card records, with expiring "not found" entries
+
+    Entries are tagged with the version of the card database they were found at, so a changed
+    cards.db is never answered from records it has since replaced.
+    """
+
+    def __init__(self, max_size=4096, not_found_ttl=300):
+        self.max_size = max_size
+        self.not_found_ttl = not_found_ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_found_hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version=None):
+        """gets a card record, NOT_FOUND, or None if the key isn't cached at this version
+
+        The version is the card database's, an entry cached at any other is out of date.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            record, expires, entry_version = entry
+            if entry_version != version or expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if record is NOT_FOUND:
+                self.not_found_hits += 1
+            else:
+                self.hits += 1
+            return record
+
+    def put(self, key, record, version=None):
+        """caches a card record found at a database version, evicting the least recently used"""
+        expires = None
+        if record is NOT_FOUND:
+            expires = time.monotonic() + self.not_found_ttl
+        with self._lock:
+            self._entries[key] = (record, expires, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """empties the cache and resets its counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.not_found_hits = 0
+
+    def stats(self):
+        """gets the cache's size and hit/miss counters"""
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "not_found_hits": self.not_found_hits}
+
+CARD_CACHE = CardCache()
@@ -0,0 +1,154 @@
+"""Module containing the card database schema and its migrations"""
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+DATABASE_PATH = Path(os.environ.get("CARDS_DB", Path(__file__).parent.resolve() / "cards.db"))
+# set when cards.db is prebuilt and never written while the site is running,
+# lets sqlite skip locking and change detection entirely
+IMMUTABLE = os.environ.get("CARDS_DB_IMMUTABLE") == "1"
+# number of prepared statements each connection keeps compiled
+CACHED_STATEMENTS = 128
+
+# each entry upgrades the schema by one version, the version is stored in PRAGMA user_version
+MIGRATIONS = [
+    # 1: original table, kept as-is so databases made before versioning are picked up as v1
+    "CREATE TABLE IF NOT EXISTS 'cards'("
+    "'name' TEXT NOT NULL, 'setCode' TEXT NOT NULL, 'collNo' INTEGER NOT NULL, "
+    "'regMark' TEXT NOT NULL, 'type' TEXT NOT NULL, "
+    "'isStandardLegal' BOOLEAN NOT NULL CHECK (isStandardLegal IN (0, 1)), "
+    "'isExpandedLegal' BOOLEAN NOT NULL CHECK (isExpandedLegal IN (0, 1)));",
+    # 2: primary key, unique printing, zero-stripped collector number and lookup indexes
+    "CREATE TABLE 'cards_v2'("
+    "'id' INTEGER PRIMARY KEY, "
+    "'name' TEXT NOT NULL, 'setCode' TEXT NOT NULL, 'collNo' INTEGER NOT NULL, "
+    "'collNoNorm' TEXT GENERATED ALWAYS AS (ltrim(collNo, '0')) STORED, "
+    "'regMark' TEXT NOT NULL, 'type' TEXT NOT NULL, "
+    "'isStandardLegal' BOOLEAN NOT NULL CHECK (isStandardLegal IN (0, 1)), "
+    "'isExpandedLegal' BOOLEAN NOT NULL CHECK (isExpandedLegal IN (0, 1)), "
+    "UNIQUE ('setCode', 'collNo'));"
+    # duplicate rows can exist from racing inserts, the first one inserted wins
+    "INSERT OR IGNORE INTO cards_v2 "
+    "(name, setCode, collNo, regMark, type, isStandardLegal, isExpandedLegal) "
+    "SELECT name, setCode, collNo, regMark, type, isStandardLegal, isExpandedLegal "
+    "FROM cards ORDER BY rowid;"
+    "DROP TABLE cards;"
+    "ALTER TABLE cards_v2 RENAME TO cards;"
+    # also serves lookups by name alone, so name doesn't get an index of its own
+    "CREATE INDEX 'cards_name_set' ON cards (name, setCode);",
+    # 3: sets brought in by tools/import_cards.py, so re-syncs can skip sets that haven't changed
+    "CREATE TABLE 'cardSets'("
+    "'id' TEXT PRIMARY KEY, 'setCode' TEXT NOT NULL, 'updatedAt' TEXT, "
+    "'checksum' TEXT NOT NULL, 'cardCount' INTEGER NOT NULL);",
+    # 4: names normalized like card_matcher.normalize_name, with a trigram index over them
+    # for matching misspelled names
+    "ALTER TABLE cards ADD COLUMN 'nameNorm' TEXT GENERATED ALWAYS AS (lower("
+    "replace(replace(replace(replace(name, 'É', 'e'), 'é', 'e'), '''', ''), '’', ''))) VIRTUAL;"
+    "CREATE VIRTUAL TABLE 'cardNames' USING fts5("
+    "nameNorm, content='cards', content_rowid='id', tokenize='trigram');"
+    "INSERT INTO cardNames (cardNames) VALUES ('rebuild');"
+    "CREATE TRIGGER 'cards_names_insert' AFTER INSERT ON cards BEGIN "
+    "INSERT INTO cardNames (rowid, nameNorm) VALUES (new.id, new.nameNorm); END;"
+    "CREATE TRIGGER 'cards_names_delete' AFTER DELETE ON cards BEGIN "
+    "INSERT INTO cardNames (cardNames, rowid, nameNorm) VALUES ('delete', old.id, old.nameNorm);"
+    " END;"
+    "CREATE TRIGGER 'cards_names_update' AFTER UPDATE OF name ON cards BEGIN "
+    "INSERT INTO cardNames (cardNames, rowid, nameNorm) VALUES ('delete', old.id, old.nameNorm);"
+    "INSERT INTO cardNames (rowid, nameNorm) VALUES (new.id, new.nameNorm); END;",
+    # 5: formats and their legality by set code and regulation mark, see format_rules.py
+    "CREATE TABLE 'formats'("
+    "'id' TEXT PRIMARY KEY, 'name' TEXT NOT NULL, 'deckSize' INTEGER NOT NULL, "
+    "'maxCopies' INTEGER NOT NULL, "
+    "'fallback' TEXT CHECK (fallback IN ('standard', 'expanded')));"
+    "CREATE TABLE 'formatLegality'("
+    "'format' TEXT NOT NULL, 'setCode' TEXT NOT NULL, 'regMark' TEXT NOT NULL, "
+    "'isLegal' BOOLEAN NOT NULL CHECK (isLegal IN (0, 1)), "
+    "PRIMARY KEY ('format', 'setCode', 'regMark'));"
+    "CREATE TABLE 'formatBans'("
+    "'format' TEXT NOT NULL, 'name' TEXT NOT NULL, PRIMARY KEY ('format', 'name'));"
+    # no legality rows, standard and expanded go by the legality the importer and API give cards
+    "INSERT INTO formats VALUES "
+    "('standard', 'Standard', 60, 4, 'standard'), ('expanded', 'Expanded', 60, 4, 'expanded');",
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# adds a printing, or updates it if the set already has one with that collector number
+UPSERT_CARD = "INSERT INTO cards "\
+              "(name, setCode, collNo, regMark, type, isStandardLegal, isExpandedLegal) "\
+              "VALUES (?, ?, ?, ?, ?, ?, ?) "\
+              "ON CONFLICT (setCode, collNo) DO UPDATE SET name=excluded.name, "\
+              "regMark=excluded.regMark, type=excluded.type, "\
+              "isStandardLegal=excluded.isStandardLegal, isExpandedLegal=excluded.isExpandedLegal"
+
+# the columns CardInfo.update_from_database reads, rows are matched to cards by the last four
+CARD_COLUMNS = "cards.regMark, cards.type, cards.isStandardLegal, cards.isExpandedLegal, "\
+               "cards.collNo, cards.name, cards.setCode, cards.collNoNorm, cards.id"
+
+def get_version(conn):
+    """gets the schema version of a database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn, target=SCHEMA_VERSION):
+    """upgrades a database in place, returns the versions it went from and to"""
+    start = get_version(conn)
+    if start > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema v{start} is newer than this code (v{SCHEMA_VERSION})")
+    for version in range(start + 1, target + 1):
+        # each migration and its version bump are committed together or not at all
+        try:
+            conn.executescript("BEGIN;" + MIGRATIONS[version - 1] +
+                               f"PRAGMA user_version = {version};COMMIT;")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return start, get_version(conn)
+
+def connect(path=DATABASE_PATH):
+    """opens a read-write connection to the card database"""
+    return sqlite3.connect(path)
+
+_readers = threading.local()
+_writer = None
+_writer_lock = threading.Lock()
+
+def reader():
+    """gets this thread's read-only connection, opening it on first use"""
+    # connections can't cross a fork, so a worker re-opens anything its parent opened
+    if getattr(_readers, "pid", None) != os.getpid():
+        uri = DATABASE_PATH.as_uri() + "?mode=ro"
+        if IMMUTABLE:
+            uri += "&immutable=1"
+        _readers.conn = sqlite3.connect(uri, uri=True, cached_statements=CACHED_STATEMENTS)
+        _readers.pid = os.getpid()
+    return _readers.conn
+
+def close_reader():
+    """closes this thread's read connection, the next read opens a new one"""
+    if getattr(_readers, "pid", None) == os.getpid():
+        _readers.conn.close()
+    _readers.pid = None
+
+def read(query, query_data=()):
+    """runs a query on this thread's read connection"""
+    return reader().execute(query, tuple(query_data)).fetchall()
+
+def write(query, query_data=()):
+    """runs a statement on the process' single writer connection and commits it"""
+    write_many(query, [query_data])
+
+def write_many(query, rows):
+    """runs a statement for each row on the process' single writer connection, in one transaction"""
+    global _writer # pylint: disable=global-statement
+    with _writer_lock:
+        if _writer is None or _writer[0] != os.getpid():
+            conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False,
+                                   cached_statements=CACHED_STATEMENTS)
+            # lets readers keep going while the writer holds its lock
+            conn.execute("PRAGMA journal_mode=WAL")
+            _writer = (os.getpid(), conn)
+        conn = _writer[1]
+        with conn:
+            conn.executemany(query, (tuple(row) for row in rows))
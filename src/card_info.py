@@ -1,45 +1,69 @@
 """Module containing pokemon card class"""
 
+import copy
 import logging
 import re
-import sqlite3
-from functools import cached_property, total_ordering
-from pathlib import Path
-from pokemontcgsdk import Card, RestClient
+from collections import namedtuple
+from functools import total_ordering
+import card_api
+import card_database
+import card_matcher
+import card_snapshot
+from card_writer import CARD_WRITER
+import metrics
 from exceptions import CardError
 
+# rows are card_database.CARD_COLUMNS, see update_from_database
+DATABASE_QUERY_ROOT = f"SELECT {card_database.CARD_COLUMNS} FROM cards WHERE "
+
+# resolved card information, immutable so one record can be shared by every deck and thread,
+# only ever made from what the database or the API has, so there is at most one per printing
+CardRecord = namedtuple("CardRecord", [
+    "name", "set_code", "collector_number", "regulation_mark", "supertype", "standard_legal",
+    "expanded_legal"
+])
+_records = {}
+# written with set code ENERGY on decklists, but saved under the set they were printed in
+BASIC_ENERGIES = (
+    "Grass Energy", "Fire Energy", "Water Energy", "Lightning Energy", "Psychic Energy",
+    "Fighting Energy", "Darkness Energy", "Metal Energy", "Fairy Energy"
+)
+
+def intern_record(*fields):
+    """Gets the shared record for a card's resolved information"""
+    record = CardRecord(*fields)
+    return _records.setdefault(record, record)
+
+def is_basic_energy(record):
+    """Whether a record is a basic energy, whether or not its name starts with Basic"""
+    return record.supertype == "Energy" and record.name.removeprefix("Basic ") in BASIC_ENERGIES
+
 @total_ordering
 class CardInfo:
-    """Class representing a pokemon card"""
-
-    name = None
-    set_code = None
-    collector_number = None
-    regulation_mark = None
-    supertype = None
-    legality = {"standard": None, "expanded": None}
-    quantity = None
-
-    def __init__(self, *, name=None, set_code=None, collector_number=None, regulation_mark=None,
-                 supertype=None, quantity=None):
+    """Class representing a pokemon card on a decklist
+
+    Only what was written on the decklist and the quantity belong to the card itself, what
+    it resolves to is a shared CardRecord.
+    """
+
+    __slots__ = ("name", "set_code", "collector_number", "quantity", "record")
+
+    def __init__(self, *, name=None, set_code=None, collector_number=None, quantity=None):
+        self.name = None
+        self.set_code = None
+        self.collector_number = None
+        self.quantity = None
+        self.record = None
         if name:
             self.name = str(name).strip().removeprefix("Basic ")
         if set_code:
             self.set_code = str(set_code).strip().upper()
         if collector_number:
             self.collector_number = str(collector_number).strip().upper()
-        if regulation_mark:
-            self.regulation_mark = str(regulation_mark).strip().upper()
-        if supertype:
-            self.supertype = str(supertype).strip()
         if quantity:
             self.quantity = int(quantity)
         #special formatting for basic energies
-        basic_energies = [
-            "Grass Energy", "Fire Energy", "Water Energy", "Lightning Energy", "Psychic Energy",
-            "Fighting Energy", "Darkness Energy", "Metal Energy", "Fairy Energy"
-        ]
-        if self.name in basic_energies:
+        if self.name in BASIC_ENERGIES:
             self.set_code = "ENERGY"
         #ptcgl formats basic energy cards weird, we need to correct that
         if self.set_code == "ENERGY":
@@ -62,116 +86,151 @@ class CardInfo:
                 self.set_code = "PR"
 
     def __eq__(self, other):
-        if self.get_supertype == other.get_supertype:
-            if self.get_supertype in ("Trainer", "Energy"):
-                if self.get_name == other.get_name:
-                    return True
-            else:
-                if self.get_name == other.get_name and \
-                   self.get_set_code == other.get_set_code and \
-                   self.get_collector_number == other.get_collector_number:
-                    return True
-        return False
+        return self.identity() == other.identity()
+
+    def identity(self):
+        """Gets what makes two cards the same entry on a decklist"""
+        if self.get_supertype in ("Trainer", "Energy"):
+            return (self.get_supertype, self.get_name)
+        return (self.get_supertype, self.get_name, self.get_set_code, self.get_collector_number)
 
     def __lt__(self, other):
         return self.get_name < other.get_name
 
+    @property
+    def resolved(self):
+        """whether this card has been looked up"""
+        return self.record is not None
+
     def update_from_database(self, result):
-        """Updates this object with information from local card database"""
-        self.regulation_mark = result[0]
-        self.supertype = result[1]
-        self.legality["standard"] = result[2]
-        self.legality["expanded"] = result[3]
-        if not self.collector_number:
-            self.collector_number = str(result[4]).strip().upper()
+        """Updates this object with a row from the local card database"""
+        self.record = intern_record(result[5], result[6], str(result[4]).strip().upper(),
+                                    result[0], result[1], bool(result[2]), bool(result[3]))
 
-    def query_database(self, query, query_data):
-        """Queries local database for card information"""
-        conn = sqlite3.connect(Path(__file__).parent.resolve() / "cards.db")
-        cursor = conn.cursor()
-        results = cursor.execute(query, tuple(query_data)).fetchall()
-        conn.close()
-        if len(results) == 1:
-            self.update_from_database(results[0])
+    def match_from_database(self):
+        """Matches this card's name to the closest name in the local database"""
+        result = self.pick_result(card_matcher.match(self))
+        if result:
+            self.update_from_database(result)
             return True
+        return False
+
+    def cache_key(self):
+        """Gets the normalized key this card's lookups are cached under"""
+        collector_number = self.collector_number
+        if collector_number:
+            collector_number = collector_number.lstrip("0")
+        return (self.name, self.set_code, collector_number)
+
+    def to_record(self):
+        """Gets the record this card resolved to"""
+        return self.record
+
+    def copy(self):
+        """Makes a copy of this card that can be resolved separately"""
+        return copy.copy(self)
+
+    def update_from_record(self, record):
+        """Updates this object with a record another card resolved to"""
+        self.record = record
+
+    @staticmethod
+    def pick_result(results):
+        """Picks the database row a search resolves to, if it is unambiguous"""
+        if len(results) == 1:
+            return results[0]
         if len(results) > 1:
             supertype = results[0][1]
             if supertype in ["Trainer", "Energy"]:
-                self.update_from_database(results[0])
-                return True
-        return False
+                return results[0]
+        return None
 
-    def lookup_from_database(self):
-        """Creates and runs queries to get card information from local database"""
-        query_root = "SELECT regMark, type, isStandardLegal, isExpandedLegal, collNo "\
-                     "FROM cards WHERE "
+    def lookup_keys(self):
+        """Lists the (columns, values) this card is searched by, in order of precedence"""
+        keys = []
         if self.name and self.set_code and self.collector_number:
-            query = query_root + "name=? AND setCode=? AND collNo=?"
-            query_data = [self.name, self.set_code, self.collector_number]
-            if self.query_database(query, query_data):
-                return
+            keys.append((("name", "setCode", "collNo"),
+                         (self.name, self.set_code, self.collector_number)))
         if self.set_code and self.collector_number:
-            query = query_root + "setCode=? AND collNo=?"
-            query_data = [self.set_code, self.collector_number]
-            if self.query_database(query, query_data):
-                return
+            keys.append((("setCode", "collNo"), (self.set_code, self.collector_number)))
         if self.name and self.set_code:
-            query = query_root + "name=? AND setCode=?"
-            query_data = [self.name, self.set_code]
-            if self.query_database(query, query_data):
-                return
+            keys.append((("name", "setCode"), (self.name, self.set_code)))
         if self.name:
-            query = query_root + "name=?"
-            query_data = [self.name]
-            if self.query_database(query, query_data):
-                return
+            keys.append((("name",), (self.name,)))
         if self.name and self.set_code:
-            query = query_root + "name=?"
-            query_data = [' '.join([self.name, self.set_code])]
-            if self.query_database(query, query_data):
+            keys.append((("name",), (' '.join([self.name, self.set_code]),)))
+        return keys
+
+    def query_database(self, query, query_data):
+        """Queries local database for card information"""
+        result = self.pick_result(card_database.read(query, query_data))
+        if result:
+            self.update_from_database(result)
+            return True
+        return False
+
+    def query_snapshot(self, snapshot, columns, query_data):
+        """Looks card information up in the in-memory copy of the local database"""
+        result = self.pick_result(snapshot.lookup(columns, query_data))
+        if result:
+            self.update_from_database(result)
+            return True
+        return False
+
+    def lookup_from_database(self):
+        """Creates and runs queries to get card information from local database"""
+        snapshot = card_snapshot.SNAPSHOT.get() if card_snapshot.SNAPSHOT else None
+        with metrics.timed("db"):
+            for columns, query_data in self.lookup_keys():
+                if snapshot:
+                    found = self.query_snapshot(snapshot, columns, query_data)
+                else:
+                    query = DATABASE_QUERY_ROOT + \
+                            " AND ".join(f"{column}=?" for column in columns) + " ORDER BY id"
+                    found = self.query_database(query, query_data)
+                if found:
+                    metrics.DB_HITS.inc()
+                    return
+            if self.match_from_database():
+                metrics.DB_HITS.inc()
                 return
+        metrics.DB_MISSES.inc()
         # if we still haven't foind it locally, try the API
+        self.backfill_from_api()
+
+    def backfill_from_api(self):
+        """Looks this card up from the remote API and saves it locally"""
         api_success = self.lookup_from_api()
-        # if it was found by the API, save it locally
+        # if it was found by the API, save it locally without waiting on the database's lock
         if api_success:
-            conn = sqlite3.connect(
-                Path(__file__).parent.resolve() / "cards.db")
-            cursor = conn.cursor()
-            query = "INSERT INTO cards "\
-                    "(name, setCode, collNo, regMark, type, isStandardLegal, isExpandedLegal) "\
-                    "VALUES (?, ?, ?, ?, ?, ?, ?)"
-            cursor.execute(query, (
-                self.name, self.set_code, self.collector_number, self.regulation_mark,
-                self.supertype, self.legality["standard"], self.legality["expanded"]
-            ))
-            conn.commit()
-            conn.close()
+            CARD_WRITER.put(self.record)
             return
-        raise CardError(f"Card not found: {self.name} {self.set_code} {self.collector_number}")
+        raise self.not_found_error()
+
+    def not_found_error(self, reason="Card not found"):
+        """Makes the error reported when this card can't be found, with names it may have meant"""
+        message = f"{reason}: {self.name} {self.set_code} {self.collector_number}"
+        name = self.name
+        if name and self.set_code and not self.collector_number:
+            name = ' '.join([name, self.set_code])
+        suggestions = card_matcher.suggest(name) if name else []
+        if len(suggestions) > 1:
+            message += f". Did you mean {', '.join(suggestions[:-1])} or {suggestions[-1]}?"
+        elif suggestions:
+            message += f". Did you mean {suggestions[0]}?"
+        return CardError(message, self)
 
     def update_from_api(self, card):
         """Updates this object with information from remote card API"""
-        if not self.name:
-            self.name = card.name
-        if not self.set_code:
-            self.set_code = card.set.ptcgoCode
-        if not self.collector_number:
-            self.collector_number = card.number
-        if not self.regulation_mark:
-            if card.regulationMark:
-                self.regulation_mark = card.regulationMark
-            else:
-                self.regulation_mark = "NA"
-        if not self.supertype:
-            self.supertype = card.supertype
-        if not self.legality["standard"]:
-            self.legality["standard"] = card.legalities.standard == "Legal"
-        if not self.legality["expanded"]:
-            self.legality["expanded"] = card.legalities.expanded == "Legal"
+        # the set code and number it was searched by are kept, so it's saved under them
+        self.record = intern_record(
+            card.name, self.set_code or card.set.ptcgoCode,
+            self.collector_number or card.number, card.regulationMark or "NA", card.supertype,
+            card.legalities.standard == "Legal", card.legalities.expanded == "Legal")
 
     def query_api(self, search):
         """Queries remote API for card information"""
-        cards = Card.where(q=search, orderBy='-set.releaseDate')
+        cards = card_api.search(search)
         if len(cards) == 1:
             self.update_from_api(cards[0])
             return True
@@ -191,16 +250,7 @@ class CardInfo:
         collector_number = self.collector_number
         if collector_number:
             collector_number = collector_number.lstrip("0")
-        #connect to API
-        try:
-            api_key_path = Path(__file__).parents[1].resolve() / "res" / "APIkey.txt"
-            with open(api_key_path, encoding="utf-8") as reader:
-                api_key = reader.read().strip()
-                # connect to API
-                RestClient.configure(api_key)
-        except OSError:
-            logging.warning("API key not found")
-        # start querying API
+        # start querying API, card_api reads the API key on its first search
         if self.name and set_code and collector_number:
             search = f'!name:"{self.name}" {set_search}:"{set_code}" number:{collector_number}'
             if self.query_api(search):
@@ -223,51 +273,51 @@ class CardInfo:
                 return True
         return False
 
-    @cached_property
+    @property
     def get_name(self):
         """gets this card's name"""
-        if not self.name:
+        if not self.record:
             self.lookup_from_database()
-        return self.name
+        return self.record.name
 
-    @cached_property
+    @property
     def get_set_code(self):
         """gets this card's set code"""
-        if not self.set_code:
+        if not self.record:
             self.lookup_from_database()
-        return self.set_code
+        return self.record.set_code
 
-    @cached_property
+    @property
     def get_collector_number(self):
         """gets this card's collector number"""
-        if not self.collector_number:
+        if not self.record:
             self.lookup_from_database()
-        return self.collector_number
+        return self.record.collector_number
 
-    @cached_property
+    @property
     def get_supertype(self):
         """gets this card's supertype"""
-        if not self.supertype:
+        if not self.record:
             self.lookup_from_database()
-        return self.supertype
+        return self.record.supertype
 
-    @cached_property
+    @property
     def get_regulation_mark(self):
         """gets this card's regulation mark"""
-        if not self.regulation_mark:
+        if not self.record:
             self.lookup_from_database()
-        return self.regulation_mark
+        return self.record.regulation_mark
 
-    @cached_property
+    @property
     def get_standard_legality(self):
         """gets this card's standard legality"""
-        if not self.legality["standard"]:
+        if not self.record:
             self.lookup_from_database()
-        return self.legality["standard"]
+        return self.record.standard_legal
 
-    @cached_property
+    @property
     def get_expanded_legality(self):
         """gets this card's expanded legality"""
-        if not self.legality["expanded"]:
+        if not self.record:
             self.lookup_from_database()
-        return self.legality["expanded"]
+        return self.record.expanded_legal
@@ -0,0 +1,69 @@
+"""Module that matches misspelled card names against the trigram index in the card database"""
+
+from difflib import SequenceMatcher
+import card_database
+
+MATCH_QUERY = f"SELECT {card_database.CARD_COLUMNS} "\
+              "FROM cardNames JOIN cards ON cards.id = cardNames.rowid "\
+              "WHERE cardNames MATCH ? ORDER BY rank LIMIT ?"
+# rows read per search, enough for every printing of the closest few names
+MATCH_LIMIT = 200
+# how alike a name has to be to the one written to be picked without asking
+MATCH_THRESHOLD = 0.85
+SUGGESTION_THRESHOLD = 0.6
+
+def normalize_name(name):
+    """normalizes a name the same way as the nameNorm column in the card database"""
+    for old, new in (("É", "e"), ("é", "e"), ("'", ""), ("’", "")):
+        name = name.replace(old, new)
+    return name.lower()
+
+def search(name):
+    """gets the rows whose names share the most trigrams with a name, best first"""
+    normalized = normalize_name(name)
+    trigrams = {normalized[index:index + 3] for index in range(len(normalized) - 2)}
+    if not trigrams:
+        return []
+    query = " OR ".join('"' + trigram.replace('"', '""') + '"' for trigram in sorted(trigrams))
+    return card_database.read(MATCH_QUERY, (query, MATCH_LIMIT))
+
+def rank(name, rows):
+    """groups rows by name, returns (similarity, name, rows) with the most similar name first"""
+    normalized = normalize_name(name)
+    by_name = {}
+    for row in rows:
+        by_name.setdefault(row[5], []).append(row)
+    ranked = [(SequenceMatcher(None, normalized, normalize_name(candidate)).ratio(), candidate,
+               sorted(candidate_rows, key=lambda row: row[8]))
+              for candidate, candidate_rows in by_name.items()]
+    return sorted(ranked, key=lambda match: (-match[0], match[1]))
+
+def match_name(name, set_code=None, collector_number=None):
+    """gets the rows of the one name clearly closest to a name, of a printing if one is given"""
+    ranked = rank(name, search(name))
+    if not ranked or ranked[0][0] < MATCH_THRESHOLD:
+        return []
+    if len(ranked) > 1 and ranked[1][0] >= ranked[0][0]:
+        return []
+    rows = ranked[0][2]
+    # only the printing written is picked, one that isn't saved yet is left for the API
+    if set_code:
+        rows = [row for row in rows if row[6] == set_code]
+        if collector_number:
+            rows = [row for row in rows if row[7] == collector_number.lstrip("0")]
+    return rows
+
+def match(card):
+    """gets the rows a card with a misspelled name most likely means, for pick_result"""
+    if not card.name:
+        return []
+    rows = match_name(card.name, card.set_code, card.collector_number)
+    if not rows and card.set_code and not card.collector_number:
+        # the last word of a line without a number may be part of the name, like "Professor Oak"
+        rows = match_name(f"{card.name} {card.set_code}")
+    return rows
+
+def suggest(name, limit=3):
+    """gets the names in the card database most like a name"""
+    return [candidate for similarity, candidate, _ in rank(name, search(name))[:limit]
+            if similarity >= SUGGESTION_THRESHOLD]
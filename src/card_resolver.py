@@ -0,0 +1,180 @@
+"""Module that resolves many pokemon cards against the local card database at once"""
+
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import wait
+import card_database
+import card_snapshot
+import metrics
+from card_api import API_EXECUTOR
+from card_cache import CARD_CACHE, NOT_FOUND
+from card_info import CardInfo
+from exceptions import CardError
+
+# seconds a request waits on API lookups for the cards missing locally
+API_DEADLINE = float(os.environ.get("CARD_API_DEADLINE", 20))
+
+def backfill(card):
+    """Looks a card up from the API and saves it locally, returns the card"""
+    card.backfill_from_api()
+    return card
+
+class CardResolver:
+    """Class that resolves a batch of cards in one database round trip"""
+
+    def __init__(self, api_deadline=API_DEADLINE):
+        self.api_deadline = api_deadline
+
+    def fetch_candidates(self, cards):
+        """Gets every row any of the cards could resolve to, in insertion order"""
+        names = set()
+        numbers = set()
+        for card in cards:
+            for columns, query_data in card.lookup_keys():
+                if "collNo" in columns:
+                    numbers.add((card.set_code, card.collector_number))
+                else:
+                    names.add(query_data[0])
+        if not names and not numbers:
+            return []
+        if card_snapshot.SNAPSHOT:
+            with metrics.timed("db"):
+                return card_snapshot.SNAPSHOT.get().candidates(names, numbers)
+        queries = []
+        query_data = []
+        if numbers:
+            values = ", ".join(["(?, ?)"] * len(numbers))
+            queries.append(f"WITH wanted(setCode, collNo) AS (VALUES {values}) "
+                           f"SELECT {card_database.CARD_COLUMNS} FROM cards JOIN wanted "
+                           "ON cards.setCode = wanted.setCode AND cards.collNo = wanted.collNo")
+            query_data.extend(value for number in numbers for value in number)
+        if names:
+            queries.append(f"SELECT {card_database.CARD_COLUMNS} FROM cards "
+                           f"WHERE cards.name IN ({', '.join('?' * len(names))})")
+            query_data.extend(names)
+        with metrics.timed("db"):
+            return card_database.read(" UNION ".join(queries) + " ORDER BY 9", query_data)
+
+    def resolve_many(self, cards):
+        """Resolves every unresolved card, returns the errors for cards that couldn't be found"""
+        version = card_snapshot.database_version()
+        errors, missing, uncached = self.resolve_locally(cards, version)
+        errors.extend(self.resolve_from_api(missing, version))
+        self.share_records(uncached)
+        return errors
+
+    async def resolve_many_async(self, cards):
+        """Resolves every unresolved card like resolve_many, awaiting API lookups"""
+        # only the async server uses asyncio, which is slow to import
+        import asyncio # pylint: disable=import-outside-toplevel
+        version = await asyncio.to_thread(card_snapshot.database_version)
+        errors, missing, uncached = await asyncio.to_thread(self.resolve_locally, cards, version)
+        futures = self.submit_backfills(missing)
+        if futures:
+            waiters = [asyncio.wrap_future(future) for future in futures]
+            for waiter in waiters:
+                # collect_backfills reports failures from the lookups' own futures, this keeps
+                # asyncio from logging them again, even for lookups that finish after the deadline
+                waiter.add_done_callback(lambda waiter: waiter.cancelled() or waiter.exception())
+            await asyncio.wait(waiters, timeout=self.api_deadline)
+        errors.extend(self.collect_backfills(futures, version))
+        self.share_records(uncached)
+        return errors
+
+    def resolve_locally(self, cards, version=None):
+        """Resolves cards from the cache and the database, caching them at the database's version
+
+        The version is card_snapshot.database_version() from before anything is looked up.
+        Returns the errors so far, the cards left for the API, and the cards grouped by key.
+        """
+        errors = []
+        uncached = {}
+        for card in cards:
+            if card.resolved:
+                continue
+            record = CARD_CACHE.get(card.cache_key(), version)
+            if record is NOT_FOUND:
+                errors.append(card.not_found_error())
+            elif record:
+                card.update_from_record(record)
+            else:
+                uncached.setdefault(card.cache_key(), []).append(card)
+        # only one card per key is looked up, so repeats resolve the same way they would from cache
+        cards = [same_cards[0] for same_cards in uncached.values()]
+        by_name = defaultdict(list)
+        by_number = defaultdict(list)
+        for row in self.fetch_candidates(cards):
+            by_name[row[5]].append(row)
+            by_number[(row[6], row[7])].append(row)
+        missing = []
+        for card in cards:
+            key = card.cache_key()
+            for columns, query_data in card.lookup_keys():
+                # narrow the candidates exactly like the WHERE clause in lookup_from_database
+                if "collNo" in columns:
+                    rows = by_number[(card.set_code, card.collector_number.lstrip("0"))]
+                    if "name" in columns:
+                        rows = [row for row in rows if row[5] == card.name]
+                else:
+                    rows = by_name[query_data[0]]
+                    if "setCode" in columns:
+                        rows = [row for row in rows if row[6] == card.set_code]
+                result = CardInfo.pick_result(rows)
+                if result:
+                    card.update_from_database(result)
+                    break
+            else:
+                # one indexed search for misspelled names before going to the API
+                with metrics.timed("db"):
+                    matched = card.match_from_database()
+                if not matched:
+                    missing.append(card)
+                    continue
+            CARD_CACHE.put(key, card.to_record(), version)
+        metrics.DB_HITS.inc(len(cards) - len(missing))
+        metrics.DB_MISSES.inc(len(missing))
+        return errors, missing, uncached
+
+    @staticmethod
+    def share_records(uncached):
+        """Gives repeats of a card the record the first of them resolved to"""
+        for first, *repeats in uncached.values():
+            for card in repeats:
+                if first.resolved:
+                    card.update_from_record(first.to_record())
+
+    def resolve_from_api(self, cards, version=None):
+        """Looks cards up from the API concurrently, returns the errors for cards that failed"""
+        futures = self.submit_backfills(cards)
+        wait(futures, timeout=self.api_deadline)
+        return self.collect_backfills(futures, version)
+
+    @staticmethod
+    def submit_backfills(cards):
+        """Starts looking cards up from the API, returns the futures for each card"""
+        # lookups work on copies so one that outlives the deadline can't change the deck later
+        return {API_EXECUTOR.submit(backfill, card.copy()): card for card in cards}
+
+    @staticmethod
+    def collect_backfills(futures, version=None):
+        """Updates cards from the API lookups that finished, returns the errors for the rest
+
+        What's found is cached at the database version the cards were missing from.
+        """
+        errors = []
+        for future, card in futures.items():
+            key = card.cache_key()
+            if not future.done():
+                errors.append(card.not_found_error("Card lookup timed out"))
+                continue
+            try:
+                card.update_from_record(future.result().to_record())
+                CARD_CACHE.put(key, card.to_record(), version)
+            except CardError as error:
+                errors.append(error)
+                CARD_CACHE.put(key, NOT_FOUND, version)
+            except Exception: # pylint: disable=broad-exception-caught
+                logging.exception("API lookup failed for %s", key)
+                errors.append(card.not_found_error("Card lookup failed"))
+        return errors
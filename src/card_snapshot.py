@@ -0,0 +1,128 @@
+"""Module containing an in-memory copy of the card database, reloaded when cards.db changes"""
+
+import logging
+import os
+import threading
+import time
+import card_database
+
+# set to answer card lookups from memory instead of querying cards.db every time
+SNAPSHOT_ENABLED = os.environ.get("CARDS_DB_SNAPSHOT") == "1"
+# seconds between checks for a changed cards.db
+SNAPSHOT_CHECK_SECONDS = float(os.environ.get("CARDS_DB_SNAPSHOT_CHECK_SECONDS", 1))
+
+class CardSnapshot:
+    """Immutable copy of the cards table, indexed by every key cards are looked up by"""
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.size = len(rows)
+        self.by_name = {}
+        self.by_number = {}
+        # rows are (regMark, type, isStandardLegal, isExpandedLegal, collNo, name, setCode,
+        # collNoNorm, id), see card_database.CARD_COLUMNS, and come in id order
+        for row in rows:
+            self.by_name.setdefault(row[5], []).append(row)
+            self.by_number.setdefault((row[6], row[7]), []).append(row)
+
+    def __str__(self):
+        return f"{self.size} cards"
+
+    @classmethod
+    def load(cls, version=None):
+        """reads every card in the database into a new snapshot"""
+        return cls(card_database.read(f"SELECT {card_database.CARD_COLUMNS} FROM cards "
+                                      "ORDER BY cards.id"), version)
+
+    def lookup(self, columns, query_data):
+        """gets the rows matching one of CardInfo.lookup_keys, like a query on those columns"""
+        values = dict(zip(columns, query_data))
+        if "collNo" in values:
+            rows = self.by_number.get((values["setCode"], values["collNo"].lstrip("0")), [])
+            if "name" in values:
+                rows = [row for row in rows if row[5] == values["name"]]
+            return rows
+        rows = self.by_name.get(values["name"], [])
+        if "setCode" in values:
+            rows = [row for row in rows if row[6] == values["setCode"]]
+        return rows
+
+    def candidates(self, names, numbers):
+        """gets every row with one of the names or (set code, collector number), in id order"""
+        rows = {}
+        for name in names:
+            for row in self.by_name.get(name, []):
+                rows[row[8]] = row
+        for set_code, collector_number in numbers:
+            for row in self.by_number.get((set_code, collector_number.lstrip("0")), []):
+                rows[row[8]] = row
+        return [rows[row_id] for row_id in sorted(rows)]
+
+class FileVersion:
+    """What a holder keeps when only the database's version is needed, not a copy of it"""
+
+    def __init__(self, version=None):
+        self.version = version
+
+    def __str__(self):
+        return "cards.db version"
+
+class SnapshotHolder:
+    """Holds the current snapshot, swapping in a new one when the database file changes
+
+    The loader makes a snapshot from the database and the file version it was made at, any
+    other copy of tables kept in memory can be held the same way.
+    """
+
+    def __init__(self, path=card_database.DATABASE_PATH, check_seconds=SNAPSHOT_CHECK_SECONDS,
+                 loader=CardSnapshot.load):
+        self.path = path
+        self.loader = loader
+        self.check_seconds = check_seconds
+        self.reloads = 0
+        self._snapshot = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def file_version(self):
+        """gets what changes when the database is written, including its write-ahead log"""
+        version = []
+        for path in (self.path, self.path.with_name(self.path.name + "-wal")):
+            try:
+                stat = path.stat()
+            except OSError:
+                version.append(None)
+            else:
+                version.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(version)
+
+    def get(self):
+        """gets the current snapshot, loading a new one first if the database has changed"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and (card_database.IMMUTABLE or
+                                     now - self._checked < self.check_seconds):
+            return snapshot
+        # one thread reloads while the others keep answering from the snapshot they have
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            self._checked = now
+            version = self.file_version()
+            if self._snapshot is None or self._snapshot.version != version:
+                started = time.perf_counter()
+                self._snapshot = self.loader(version)
+                self.reloads += 1
+                logging.info("Loaded %s into memory in %.3fs", self._snapshot,
+                             time.perf_counter() - started)
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+SNAPSHOT = SnapshotHolder() if SNAPSHOT_ENABLED else None
+# the version lookups are answered at, what's cached from them is dropped when it changes
+VERSION = SNAPSHOT or SnapshotHolder(loader=FileVersion)
+
+def database_version():
+    """gets the version of cards.db lookups are answered from, checked like the snapshot is"""
+    return VERSION.get().version
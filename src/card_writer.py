@@ -0,0 +1,115 @@
+"""Module that saves cards found by the API to the card database in the background"""
+
+import atexit
+import logging
+import os
+import threading
+import card_database
+import metrics
+
+# most cards saved in one transaction, and seconds cards wait for more to be saved with them
+WRITER_BATCH_SIZE = int(os.environ.get("CARD_WRITER_BATCH_SIZE", 100))
+WRITER_FLUSH_SECONDS = float(os.environ.get("CARD_WRITER_FLUSH_SECONDS", 0.5))
+
+class CardWriter:
+    """Write-behind queue of card records, saved in batches by one thread per process
+
+    Records of the same printing queued before they're saved are only saved once. Nothing is
+    saved when cards.db is immutable.
+    """
+
+    def __init__(self, batch_size=WRITER_BATCH_SIZE, flush_seconds=WRITER_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._pending = {}
+        self._writing = 0
+        self._flushing = 0
+        self._condition = threading.Condition()
+        self._pid = None
+        self._closed = False
+
+    def put(self, record):
+        """queues a record to be saved, returns straight away"""
+        if card_database.IMMUTABLE:
+            # readers open an immutable cards.db without locking, writing it could corrupt what
+            # they read, so cards found by the API are only cached until the site restarts
+            return
+        with self._condition:
+            self._start()
+            self._pending[(record.set_code, record.collector_number.lstrip("0"))] = record
+            if len(self._pending) in (1, self.batch_size):
+                self._condition.notify_all()
+
+    def _start(self):
+        """starts this process' writer thread, threads don't survive a fork"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._closed = False
+        if self._pending:
+            # the parent's queue is the parent's to save
+            self._pending = {}
+        threading.Thread(target=self._run, name="card-writer", daemon=True).start()
+        atexit.register(self.close)
+        # worker processes leave without running atexit, but do run multiprocessing finalizers
+        from multiprocessing import util # pylint: disable=import-outside-toplevel
+        util.Finalize(self, self.close, exitpriority=10)
+
+    def _run(self):
+        """saves batches of queued records until closed"""
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if len(self._pending) < self.batch_size and not (self._closed or self._flushing):
+                    # wait a little for more cards, so one lookup doesn't cost one transaction
+                    self._condition.wait(self.flush_seconds)
+                if not self._pending:
+                    return
+                keys = list(self._pending)[:self.batch_size]
+                batch = [self._pending.pop(key) for key in keys]
+                self._writing += 1
+            try:
+                card_database.write_many(card_database.UPSERT_CARD, [
+                    (record.name, record.set_code, record.collector_number,
+                     record.regulation_mark, record.supertype, record.standard_legal,
+                     record.expanded_legal) for record in batch])
+                metrics.API_BACKFILLS.inc(len(batch))
+            except Exception: # pylint: disable=broad-exception-caught
+                # the cards are still cached, they'll be looked up again after a restart
+                logging.exception("Couldn't save %s cards found by the API", len(batch))
+            finally:
+                with self._condition:
+                    self._writing -= 1
+                    self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """waits until every record queued so far has been saved, returns whether they were"""
+        with self._condition:
+            if self._pid != os.getpid():
+                return not self._pending
+            # cuts short the writer's wait for more cards
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                return self._condition.wait_for(lambda: not self._pending and not self._writing,
+                                                timeout)
+            finally:
+                self._flushing -= 1
+
+    def close(self, timeout=10):
+        """saves everything still queued and stops the writer thread"""
+        with self._condition:
+            if self._pid != os.getpid() or self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        if not self.flush(timeout):
+            logging.warning("Gave up saving cards found by the API after %ss", timeout)
+
+    def pending(self):
+        """gets how many records are waiting to be saved"""
+        with self._condition:
+            return len(self._pending)
+
+CARD_WRITER = CardWriter()
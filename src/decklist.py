@@ -1,26 +1,154 @@
 """Module that writes pokemon decklists to deck registration sheet"""
 
-from functools import cached_property
+from functools import cache, cached_property
+import hashlib
+import json
 import re
 import logging
+import time
 from io import BytesIO
 from pathlib import Path
 from datetime import date
-from pypdf import PdfWriter, PdfReader
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from card_info import CardInfo
-from exceptions import CardError, DeckError
+from card_resolver import CardResolver
+from decklist_parser import parse_decklist
+from format_rules import SHEET_FORMATS, rules
+import metrics
+from exceptions import DeckError
+
+BLANK_SHEET_PATH = Path(__file__).parents[1].resolve() / "res" / "blank.pdf"
+
+@cache
+def blank_sheet():
+    """reads the blank deck registration sheet once per process, the page must not be modified"""
+    # pdf libraries are imported where they're used, so checking a list never loads them
+    from pypdf import PdfReader, PdfWriter # pylint: disable=import-outside-toplevel
+    with open(BLANK_SHEET_PATH, "rb") as blank_pdf:
+        page = PdfReader(BytesIO(blank_pdf.read())).pages[0]
+    # isolate the sheet's graphics state once here, like merge_page would on every request
+    contents = page["/Contents"].get_object()
+    contents.set_data(b"q\n" + contents.get_data() + b"\nQ\n")
+    # copying the page once loads every object it uses, later copies only read them
+    PdfWriter().add_page(page)
+    return page
+
+def add_sheet(output, overlay):
+    """adds a copy of the blank sheet with an overlay page drawn over it to a PdfWriter"""
+    # pylint: disable=import-outside-toplevel
+    from pypdf.generic import ArrayObject, DictionaryObject, NameObject
+    # pylint: enable=import-outside-toplevel
+    page = output.add_page(blank_sheet())
+    # the overlay's content goes after the sheet's, without parsing either content stream
+    page[NameObject("/Contents")] = ArrayObject([
+        page.raw_get("/Contents"), overlay["/Contents"].clone(output).indirect_reference])
+    # every copy of the sheet in a writer shares the sheet's objects, resources included, so
+    # each page gets its own resources instead of adding its overlay's to the shared ones
+    resources = DictionaryObject(page["/Resources"].get_object())
+    # the sheet has no fonts, so the overlay's resource names can't clash with its own
+    for category, overlay_resources in overlay["/Resources"].get_object().items():
+        overlay_resources = overlay_resources.get_object().clone(output)
+        if category in resources and category != "/ProcSet":
+            category_resources = DictionaryObject(resources[category].get_object())
+            category_resources.update(overlay_resources)
+            resources[NameObject(category)] = category_resources
+        elif category not in resources:
+            resources[NameObject(category)] = overlay_resources
+    page[NameObject("/Resources")] = resources
+    return page
+
+def draw_overlays(decklists):
+    """draws every decklist's overlay as a page of one canvas, in one pass
+
+    Returns the overlay pages in the order of the decklists, with None for decklists that
+    couldn't be drawn, and the error each of those raised keyed by its position.
+    """
+    # pylint: disable=import-outside-toplevel
+    from pypdf import PdfReader
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    # pylint: enable=import-outside-toplevel
+    errors = {}
+    if not decklists:
+        return [], errors
+    started = time.perf_counter()
+    packet = BytesIO()
+    my_canvas = canvas.Canvas(packet, pagesize=letter)
+    for index, decklist in enumerate(decklists):
+        try:
+            decklist.draw(my_canvas)
+        except Exception as error: # pylint: disable=broad-exception-caught
+            # its page is still ended but never used, so nothing it drew lands on another sheet
+            errors[index] = error
+        my_canvas.showPage()
+    my_canvas.save()
+    drawn = len(decklists) - len(errors)
+    for _ in range(drawn):
+        metrics.STAGE_SECONDS.observe((time.perf_counter() - started) / drawn, stage="draw")
+    pages = PdfReader(packet).pages if drawn else []
+    return [None if index in errors else pages[index]
+            for index in range(len(decklists))], errors
+
+def write_sheets(decklists):
+    """writes a pdf for each decklist, drawing all of them in one pass
+
+    Returns each decklist's pdf, or None if it couldn't be written, and the errors of those
+    keyed by position.
+    """
+    from pypdf import PdfWriter # pylint: disable=import-outside-toplevel
+    overlays, errors = draw_overlays(decklists)
+    pdfs = []
+    with metrics.timed("merge"):
+        for overlay in overlays:
+            if overlay is None:
+                pdfs.append(None)
+                continue
+            output = PdfWriter()
+            add_sheet(output, overlay)
+            with BytesIO() as decklist_file:
+                output.write(decklist_file)
+                pdfs.append(decklist_file.getvalue())
+    return pdfs, errors
+
+def write_combined(decklists):
+    """writes every decklist into one pdf, a sheet each, drawing all of them in one pass
+
+    The blank sheet is stored once and shared by every page. Returns the pdf, or None if no
+    decklist could be written, and the errors of those that couldn't keyed by position.
+    """
+    from pypdf import PdfWriter # pylint: disable=import-outside-toplevel
+    overlays, errors = draw_overlays(decklists)
+    if len(errors) == len(overlays):
+        return None, errors
+    with metrics.timed("merge"):
+        output = PdfWriter()
+        for overlay in overlays:
+            if overlay is not None:
+                add_sheet(output, overlay)
+        with BytesIO() as decklist_file:
+            output.write(decklist_file)
+            return decklist_file.getvalue(), errors
+
+def get_juniors_year():
+    """gets the earliest birth year in the juniors division this season"""
+    # also we need to actually update when seasons change
+    juniors_year = date.today().year - 13
+    if date.today().month < 7:
+        juniors_year += 1
+    return juniors_year
 
 class Decklist:
     """class representing a pokemon decklist"""
 
-    def __init__(self, *, player_name=None, player_id=None, birthday=None, deck=None):
+    def __init__(self, *, player_name=None, player_id=None, birthday=None, deck=None,
+                 strict=True, resolved=None):
         self.player_name = None
         self.player_id = None
         self.birthday = {"month": None, "day": None, "year": None }
         self.division = None
         self.deck = []
+        # every card read from the list and what went wrong reading it, kept for validation
+        self.cards = []
+        self.line_errors = []
+        self.card_errors = []
         self.legality = {"standard": None, "expanded": None}
         error_messages = []
         self.legality = {"standard": None, "expanded": None}
@@ -44,57 +172,52 @@ class Decklist:
             #error_messages.append("Birthday missing.")
             pass
         if deck:
-            for line in deck.splitlines():
-                line = line.strip()
-                if line and line[0].isdigit():
-                    line = line.removesuffix(" PH")
-                    line = line.split(' ')
-                    try:
-                        if line[-1][-1].isdigit():
-                            card = CardInfo(quantity=line[0], name=' '.join(line[1:-2]),
-                                            set_code=line[-2], collector_number=line[-1])
-                        else:
-                            card = CardInfo(quantity=line[0], name=' '.join(line[1:-1]),
-                                            set_code=line[-1])
-                        if self.deck and card in self.deck:
-                            self.deck[deck.index(card)].quantity += card.quantity
-                        else:
-                            self.deck.append(card)
-                    except CardError as error:
-                        error_messages.append(error.message)
-            self.deck.sort()
+            if resolved:
+                # the deck's cards, line errors and card errors from parsing and resolving it
+                # already, like the async server does while awaiting the API
+                cards, self.line_errors, self.card_errors = resolved
+            else:
+                with metrics.timed("parse"):
+                    cards, self.line_errors = parse_decklist(deck)
+                # resolve everything up front so merging by identity below doesn't query per card
+                with metrics.timed("resolve"):
+                    self.card_errors = CardResolver().resolve_many(cards)
+            error_messages.extend(self.line_errors)
+            error_messages.extend(error.message for error in self.card_errors)
+            metrics.CARDS_RESOLVED.observe(sum(card.resolved for card in cards))
+            self.cards = cards
+            entries = {}
+            for card in cards:
+                if not card.resolved:
+                    continue
+                # merged into copies, so self.cards keeps each line's own quantity
+                entry = entries.get(card.identity())
+                if entry:
+                    entry.quantity += card.quantity
+                else:
+                    entries[card.identity()] = card.copy()
+            self.deck = sorted(entries.values())
         else:
             error_messages.append("Deck is empty.")
-        if error_messages:
+        # lists are only checked, not written, when not strict, so they can be partly read
+        if error_messages and strict:
             raise DeckError(error_messages)
 
     def get_legalities(self):
         """determines if deck is standard and/or expanded legal"""
-        error_messages = []
-        self.legality["standard"] = True
-        self.legality["expanded"] = True
-        quantity = 0
-        for card in self.deck:
-            try:
-                if card.quantity > 4 and card.set_code != "ENERGY":
-                    self.legality["standard"] = False
-                    self.legality["expanded"] = False
-                    error_messages.append(f"Deck contains {card.quantity} copies of {card.name}"\
-                                        f"{card.set_code} {card.collector_number}, maximum is 4.")
-                quantity += card.quantity
-                if not card.get_standard_legality:
-                    self.legality["standard"] = False
-                if not card.get_expanded_legality:
-                    self.legality["expanded"] = False
-                if not (card.get_standard_legality or card.get_expanded_legality):
-                    error_messages.append(f"{card.name} {card.set_code} {card.collector_number} is"\
-                                          "not legal in standard or expanded.")
-            except CardError as error:
-                error_messages.append(error.message)
-        if quantity != 60:
-            self.legality["standard"] = False
-            self.legality["expanded"] = False
-            error_messages.append(f"Deck contains {quantity} cards, must be 60.")
+        with metrics.timed("legalities"):
+            self.check_legalities()
+
+    def check_legalities(self):
+        """checks every card and the deck's size against every format's rules in one pass"""
+        error_messages = [error.message for error in CardResolver().resolve_many(self.deck)]
+        check = rules().check(self.deck)
+        legality = check.formats()
+        # a deck with a card that couldn't be found isn't legal anywhere
+        if error_messages:
+            legality = dict.fromkeys(legality, False)
+        self.legality = dict.fromkeys(SHEET_FORMATS, False) | legality
+        error_messages.extend(check.messages(SHEET_FORMATS))
         if error_messages:
             raise DeckError(error_messages)
 
@@ -112,12 +235,24 @@ class Decklist:
             self.get_legalities()
         return self.legality["expanded"]
 
+    def cache_key(self):
+        """gets a hash of everything that goes into this decklist's pdf"""
+        # the format boxes depend on the format tables as well as the cards
+        contents = [self.player_name, self.player_id, self.birthday, get_juniors_year(),
+                    [[card.quantity, *card.to_record()] for card in self.deck],
+                    [self.get_standard_legality, self.get_expanded_legality]]
+        return hashlib.sha256(json.dumps(contents).encode("utf-8")).hexdigest()
+
     def write(self):
         """creates a pdf of this decklist"""
+        pdfs, errors = write_sheets([self])
+        if errors:
+            raise errors[0]
+        return pdfs[0]
+
+    def draw(self, my_canvas):
+        """draws this decklist onto the current page of a canvas, to go over the blank sheet"""
         error_messages = []
-        #initialize canvas
-        packet = BytesIO()
-        my_canvas = canvas.Canvas(packet, pagesize=letter)
         my_canvas.setFont("Helvetica", 9)
         # write player info to canvas
         info_y = 722
@@ -132,10 +267,7 @@ class Decklist:
             my_canvas.drawString(559, info_y, self.birthday["year"])
             # we still need to check the division box
             division_x = 385
-            # also we need to actually update when seasons change
-            juniors_year = date.today().year - 13
-            if date.today().month < 7:
-                juniors_year += 1
+            juniors_year = get_juniors_year()
             if int(self.birthday["year"]) >= juniors_year:
                 my_canvas.drawString(division_x, 685, '✓')
             elif int(self.birthday["year"]) <= juniors_year - 5:
@@ -164,7 +296,10 @@ class Decklist:
                 case _:
                     logging.error("%s %s %s supertype is '%s'", card.get_name, card.get_set_code,
                                 card.get_collector_number, supertype)
-                    return my_canvas, y_values
+                    # a sheet missing the rest of the deck mustn't pass for a finished one
+                    raise DeckError([f"{card.get_name} {card.get_set_code} "
+                                     f"{card.get_collector_number} has an unknown supertype "
+                                     f"'{supertype}'."])
             # always write quantity and name
             my_canvas.drawString(280, y, str(card.quantity).rjust(2))
             my_canvas.drawString(305, y, card.get_name)
@@ -185,20 +320,3 @@ class Decklist:
                     y_values["energy_y"] -= line_height
         if error_messages:
             raise DeckError(error_messages)
-        my_canvas.save()
-        #move to the beginning of the StringIO buffer
-        packet.seek(0)
-        #create a new PDF with Reportlab
-        new_pdf = PdfReader(packet)
-        #read existing PDF
-        with open(Path(__file__).parents[1].resolve() / "res" / "blank.pdf", "rb") as blank_pdf:
-            existing_pdf = PdfReader(blank_pdf)
-            output = PdfWriter()
-            #add the "watermark" (which is the new pdf) on the existing page
-            page = existing_pdf.pages[0]
-            page.merge_page(new_pdf.pages[0])
-            output.add_page(page)
-            #finally, write "output" to a temp file
-            with BytesIO() as decklist_file:
-                output.write(decklist_file)
-                return decklist_file.getvalue()
@@ -0,0 +1,57 @@
+"""Module that parses decklists exported from Pokémon TCG Live and Limitless"""
+
+import re
+from card_info import CardInfo
+
+# "Pokémon: 12" in Live exports, "Pokémon (12)" or "Pokemon - 12" elsewhere
+SECTION_PATTERN = re.compile(r"(?P<section>pok[eé]mon|trainer|energy)s?\b", re.IGNORECASE)
+SECTIONS = {"p": "Pokémon", "t": "Trainer", "e": "Energy"}
+# quantity, name and set code, then a collector number if the last part ends in a digit
+CARD_PATTERN = re.compile(r"(?P<quantity>[1-9]\d*)\s+(?P<name>.+?)"
+                          r"(?:\s+(?P<set_code>\S+)\s+(?P<collector_number>\S*\d)"
+                          r"|\s+(?P<set_only>\S*\D))"
+                          r"(?:\s+PH)?")
+# Live writes basic energy like "Basic {G} Energy"
+ENERGY_SYMBOL_PATTERN = re.compile(r"\{([GRWLPFDMY])\}")
+ENERGY_TYPES = {
+    'G': "Grass", 'R': "Fire", 'W': "Water", 'L': "Lightning", 'P': "Psychic",
+    'F': "Fighting", 'D': "Darkness", 'M': "Metal", 'Y': "Fairy"
+}
+
+def parse_decklist(lines):
+    """parses decklist text or lines, returns the cards with repeats merged and line errors
+
+    Lines for the same card are merged by a key made from the card's text alone, so parsing
+    never looks anything up. Trainers and energy listed under their section header merge by
+    name, everything else merges by name and printing.
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    entries = {}
+    errors = []
+    section = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if not line[0].isdigit():
+            match = SECTION_PATTERN.match(line)
+            if match:
+                section = SECTIONS[match["section"][0].lower()]
+            continue
+        match = CARD_PATTERN.fullmatch(line)
+        if not match:
+            errors.append(f"Couldn't read line: {line}")
+            continue
+        name = ENERGY_SYMBOL_PATTERN.sub(lambda symbol: ENERGY_TYPES[symbol[1]], match["name"])
+        card = CardInfo(quantity=match["quantity"], name=name,
+                        set_code=match["set_code"] or match["set_only"],
+                        collector_number=match["collector_number"])
+        if section in ("Trainer", "Energy"):
+            key = (section, card.name)
+        else:
+            key = card.cache_key()
+        entry = entries.setdefault(key, card)
+        if entry is not card:
+            entry.quantity += card.quantity
+    return list(entries.values()), errors
@@ -3,9 +3,11 @@
 class CardError(Exception):
     """error with a card"""
     message = None
+    card = None
 
-    def __init__(self, message):
+    def __init__(self, message, card=None):
         self.message = message
+        self.card = card
 
 class DeckError(Exception):
     """error with the deck"""
@@ -0,0 +1,214 @@
+"""Module that checks decks against every format's rules at once, from tables in cards.db
+
+A format is a row of the formats table: its deck size, how many copies of a card it allows,
+and which of a card's own standard or expanded legality it follows, if any. formatLegality
+holds what's legal by set code and regulation mark, so a rotation is one row per mark or set
+instead of an update to every card, and formatBans lists the cards a format bans by name.
+"""
+
+from collections import namedtuple
+import card_database
+import card_info
+import card_matcher
+import card_snapshot
+
+Format = namedtuple("Format", ["id", "name", "deck_size", "max_copies", "fallback"])
+
+# matches any set code or regulation mark in formatLegality
+ANY = "*"
+# formats the deck registration sheet has a box for, which can't be removed
+SHEET_FORMATS = ("standard", "expanded")
+
+def join_or(values):
+    """joins values like 'a, b or c'"""
+    values = [str(value) for value in values]
+    return " or ".join([", ".join(values[:-1]), values[-1]] if len(values) > 1 else values)
+
+class DeckCheck:
+    """What a deck broke, for every format at once, from FormatRules.check"""
+
+    def __init__(self, rules, legal, cards, copies, total):
+        self.rules = rules
+        self.legal_mask = legal
+        self.cards = cards
+        self.copies = copies
+        self.total = total
+
+    def legal(self, format_id):
+        """whether the deck is legal in a format"""
+        return bool(self.legal_mask & self.rules.bits.get(format_id, 0))
+
+    def formats(self):
+        """gets whether the deck is legal in each format, by format id"""
+        return {format_id: bool(self.legal_mask & bit)
+                for format_id, bit in self.rules.bits.items()}
+
+    def messages(self, format_ids):
+        """gets why the deck isn't legal in any of some formats, nothing if it's legal in one"""
+        mask = self.rules.mask(format_ids)
+        if self.legal_mask & mask:
+            return []
+        # a format removed from the tables can't be checked against, or be legal
+        format_ids = [format_id for format_id in format_ids if format_id in self.rules.formats]
+        if not format_ids:
+            return ["There are no formats to check the deck against."]
+        formats = [self.rules.formats[format_id] for format_id in format_ids]
+        messages = []
+        for card in self.cards:
+            if card.record and not self.rules.card_mask(card.record) & mask:
+                messages.append(f"{card.get_name} {card.get_set_code} "
+                                f"{card.get_collector_number} is not legal in "
+                                f"{join_or(format_ids)}.")
+        max_copies = max(deck_format.max_copies for deck_format in formats)
+        for name, quantity in self.copies.items():
+            if quantity > max_copies:
+                messages.append(f"Deck contains {quantity} copies of {name}, "
+                                f"maximum is {max_copies}.")
+        deck_sizes = sorted({deck_format.deck_size for deck_format in formats})
+        if self.total not in deck_sizes:
+            messages.append(f"Deck contains {self.total} cards, must be {join_or(deck_sizes)}.")
+        return messages
+
+class FormatRules:
+    """Immutable copy of the format tables, checking a deck against every format in one pass
+
+    Each format is a bit, so a card's legality everywhere is one integer and a deck's is the
+    AND of its cards'. Legality rows are matched most specific first: set code and regulation
+    mark, then set code, then regulation mark, then neither. A format with a fallback only
+    allows cards whose own legality it names allows too, so rows can rotate cards out ahead of
+    the importer but never bring back a card the importer or API says isn't legal. A format
+    without one allows just the cards its rows make legal.
+    """
+
+    def __init__(self, formats, legality, bans, version=None):
+        self.version = version
+        self.formats = {deck_format.id: deck_format for deck_format in formats}
+        self.bits = {format_id: 1 << bit for bit, format_id in enumerate(self.formats)}
+        self.all = (1 << len(self.formats)) - 1
+        self.fallback = {"standard": 0, "expanded": 0}
+        self.followers = 0
+        self.copy_limits = {}
+        self.deck_sizes = {}
+        for deck_format in formats:
+            bit = self.bits[deck_format.id]
+            if deck_format.fallback:
+                self.fallback[deck_format.fallback] |= bit
+                self.followers |= bit
+            self.copy_limits[deck_format.max_copies] = \
+                self.copy_limits.get(deck_format.max_copies, 0) | bit
+            self.deck_sizes[deck_format.deck_size] = \
+                self.deck_sizes.get(deck_format.deck_size, 0) | bit
+        # (set code, regulation mark) -> [formats with a row, formats the row makes legal]
+        self.legality = {}
+        for format_id, set_code, regulation_mark, is_legal in legality:
+            if format_id not in self.bits:
+                continue
+            masks = self.legality.setdefault((set_code, regulation_mark), [0, 0])
+            masks[0] |= self.bits[format_id]
+            if is_legal:
+                masks[1] |= self.bits[format_id]
+        # by normalized name, so a ban doesn't depend on how its apostrophes were typed
+        self.banned = {}
+        for format_id, name in bans:
+            if format_id in self.bits:
+                name = card_matcher.normalize_name(name)
+                self.banned[name] = self.banned.get(name, 0) | self.bits[format_id]
+        # cards share records, and decks share most cards, so masks are worked out once each
+        self._key_masks = {}
+        self._card_entries = {}
+
+    def __str__(self):
+        return f"{len(self.formats)} formats"
+
+    @classmethod
+    def load(cls, version=None):
+        """reads every format and its legality and bans into new rules"""
+        formats = [Format(*row) for row in card_database.read(
+            "SELECT id, name, deckSize, maxCopies, fallback FROM formats ORDER BY rowid")]
+        legality = card_database.read(
+            "SELECT format, setCode, regMark, isLegal FROM formatLegality")
+        bans = card_database.read("SELECT format, name FROM formatBans")
+        return cls(formats, legality, bans, version)
+
+    def mask(self, format_ids):
+        """gets the bits of some formats, formats that don't exist have none"""
+        mask = 0
+        for format_id in format_ids:
+            mask |= self.bits.get(format_id, 0)
+        return mask
+
+    def key_masks(self, set_code, regulation_mark):
+        """gets the formats with a legality row for a printing, and the ones it makes legal"""
+        masks = self._key_masks.get((set_code, regulation_mark))
+        if masks is None:
+            known = legal = 0
+            for key in ((set_code, regulation_mark), (set_code, ANY), (ANY, regulation_mark),
+                        (ANY, ANY)):
+                key_known, key_legal = self.legality.get(key, (0, 0))
+                # a more specific row already decided the formats in known
+                new = key_known & ~known
+                known |= new
+                legal |= key_legal & new
+            masks = self._key_masks.setdefault((set_code, regulation_mark), (known, legal))
+        return masks
+
+    def card_entry(self, record):
+        """gets the formats a resolved card is legal in, and the name its copies count under"""
+        entry = self._card_entries.get(record)
+        if entry is None:
+            known, legal = self.key_masks(record.set_code, record.regulation_mark)
+            allowed = 0
+            if record.standard_legal:
+                allowed |= self.fallback["standard"]
+            if record.expanded_legal:
+                allowed |= self.fallback["expanded"]
+            # formats that follow a card's legality only need a row not to rule it out
+            mask = (legal & ~self.followers) | ((legal | ~known) & allowed)
+            mask &= ~self.banned.get(card_matcher.normalize_name(record.name), 0)
+            # basic energy can be played in any number
+            name = None if card_info.is_basic_energy(record) else record.name
+            entry = self._card_entries.setdefault(record, (mask, name))
+        return entry
+
+    def card_mask(self, record):
+        """gets the formats a resolved card is legal in"""
+        return self.card_entry(record)[0]
+
+    def card_formats(self, record):
+        """gets the ids of the formats a resolved card is legal in"""
+        mask = self.card_mask(record)
+        return [format_id for format_id, bit in self.bits.items() if mask & bit]
+
+    def check(self, cards):
+        """checks a list of cards as one deck against every format, skipping unresolved ones"""
+        legal = self.all
+        copies = {}
+        total = 0
+        card_entries = self._card_entries
+        for card in cards:
+            entry = card_entries.get(card.record)
+            if entry is None:
+                # cards that couldn't be found are left to the resolver's errors
+                if card.record is None:
+                    continue
+                entry = self.card_entry(card.record)
+            card_mask, name = entry
+            legal &= card_mask
+            quantity = card.quantity
+            total += quantity
+            if name:
+                copies[name] = copies.get(name, 0) + quantity
+        most = max(copies.values(), default=0)
+        for max_copies, mask in self.copy_limits.items():
+            if most > max_copies:
+                legal &= ~mask
+        for deck_size, mask in self.deck_sizes.items():
+            if total != deck_size:
+                legal &= ~mask
+        return DeckCheck(self, legal, cards, copies, total)
+
+RULES = card_snapshot.SnapshotHolder(loader=FormatRules.load)
+
+def rules():
+    """gets the current format rules, reloading them if cards.db has changed"""
+    return RULES.get()
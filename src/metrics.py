@@ -0,0 +1,203 @@
+"""Module containing the site's counters and timings, rendered in the Prometheus text format
+
+Every process keeps its own numbers, so with several workers each /metrics scrape sees the
+worker that answered it.
+"""
+
+import io
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from api_cache import API_CACHE
+from card_cache import CARD_CACHE
+from pdf_cache import PDF_CACHE
+
+PREFIX = "concealedcards_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# seconds, from a cached database lookup up to an API fallback that hits its deadline
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                   10, 30)
+# share of requests profiled, and how slow a profiled request must be for its profile to be kept
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_SECONDS = float(os.environ.get("PROFILE_SLOW_SECONDS", 1))
+# profiles are saved here as .prof files if set, otherwise their top functions are logged
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+
+_metrics = []
+
+def _format_labels(names, values, extra=()):
+    """formats label names and values like {stage="db"}"""
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Metric:
+    """Base class of a named metric with optional labels"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        """gets the label values in the order the label names were given"""
+        return tuple(labels[label] for label in self.labels)
+
+    def render(self):
+        """renders this metric's help, type and samples"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        """renders each labelled value"""
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}"
+                for key, value in sorted(self._values.items())]
+
+class Counter(Metric):
+    """Metric that only goes up"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """adds to the count"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Metric set to whatever it currently is"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        """sets the current value"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(Metric):
+    """Metric counting observations into cumulative buckets, with their sum"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """counts one observation"""
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """observes how many seconds the block took"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        """renders each labelled bucket count, then the sum and count"""
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            bounds = [*(format(bound, "g") for bound in self.buckets), "+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket"
+                             f"{_format_labels(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+STAGE_SECONDS = Histogram("stage_seconds", "Seconds spent in each stage of making a sheet.",
+                          labels=("stage",))
+REQUEST_SECONDS = Histogram("request_seconds", "Seconds spent answering each request.",
+                            labels=("endpoint",))
+CARDS_RESOLVED = Histogram("cards_resolved", "Cards resolved for each decklist.",
+                           buckets=(1, 5, 10, 15, 20, 25, 30, 40, 60))
+DB_HITS = Counter("db_hits_total", "Card lookups answered by cards.db.")
+DB_MISSES = Counter("db_misses_total", "Card lookups cards.db couldn't answer.")
+API_CALLS = Counter("api_calls_total", "Searches sent to the card API.")
+API_FAILURES = Counter("api_failures_total", "Searches to the card API that raised an error.")
+API_CACHE_STATS = Gauge("api_cache", "Hits and misses of the on-disk card API response cache.",
+                        labels=("stat",))
+API_BACKFILLS = Counter("api_backfills_total", "Cards found by the API and saved to cards.db.")
+CARD_CACHE_STATS = Gauge("card_cache", "Size and counters of the resolved card cache.",
+                         labels=("stat",))
+PDF_CACHE_STATS = Gauge("pdf_cache", "Size and counters of the generated sheet cache.",
+                        labels=("stat",))
+SHEETS_PENDING = Gauge("sheets_pending", "Sheet requests being worked on by the async server.")
+SHEETS_REJECTED = Counter("sheets_rejected_total",
+                          "Sheet requests turned away because too many were pending.")
+STARTUP_SECONDS = Gauge("startup_seconds", "Seconds each warmup step took in this process.",
+                        labels=("step",))
+
+def timed(stage):
+    """times a block as one stage of making a sheet"""
+    return STAGE_SECONDS.time(stage=stage)
+
+def update_cache_stats():
+    """copies the card, pdf and API response caches' counters into their gauges"""
+    for name, value in CARD_CACHE.stats().items():
+        CARD_CACHE_STATS.set(value, stat=name)
+    for name, value in PDF_CACHE.stats().items():
+        PDF_CACHE_STATS.set(value, stat=name)
+    for name, value in API_CACHE.stats().items():
+        API_CACHE_STATS.set(value, stat=name)
+
+def render():
+    """renders every metric in the Prometheus text format"""
+    return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
+
+def start_profile():
+    """starts profiling this thread for a sampled share of requests, returns the profiler"""
+    if not PROFILE_SAMPLE_RATE or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    import cProfile # pylint: disable=import-outside-toplevel
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is already running on this thread
+        return None
+    return profiler
+
+def finish_profile(profiler, name, seconds):
+    """stops a profiler, keeps its profile if the request was slow"""
+    profiler.disable()
+    if seconds < PROFILE_SLOW_SECONDS:
+        return
+    if PROFILE_DIR:
+        path = Path(PROFILE_DIR) / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
+        logging.warning("Slow request to %s took %.3fs, profile saved to %s", name, seconds, path)
+        return
+    import pstats # pylint: disable=import-outside-toplevel
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(20)
+    logging.warning("Slow request to %s took %.3fs\n%s", name, seconds, report.getvalue())
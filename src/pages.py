@@ -0,0 +1,19 @@
+"""Module containing what the homepage is rendered with, for both ways of serving the site"""
+
+def site_context(debug=False, warnings=None, name=None, player_id=None, birthday=None,
+                 decklist=None):
+    """gets the values site.html is rendered with"""
+    title = "Concealed Cards"
+    if debug:
+        title += " β"
+    description = "Concealed Cards fills out Pokémon TCG deck registration sheets so you don't"\
+                  "have to."
+    favicon_alt = "A simplified graphic of a water energy in front of two face-down cards."
+    error_messages = None
+    if warnings:
+        error_messages = "\r\n".join(warnings)
+    if not decklist:
+        decklist = ""
+    return {"title": title, "description": description, "favicon_alt": favicon_alt,
+            "error_messages": error_messages, "name": name, "id": player_id,
+            "birthday": birthday, "decklist": decklist}
@@ -0,0 +1,109 @@
+"""Module containing the cache of generated deck registration sheets"""
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+class PdfCache:
+    """LRU cache of pdf bytes bounded by total size, with an optional directory behind it"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None, directory_max_bytes=None):
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory else None
+        self.directory_max_bytes = directory_max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        """gets where a key is stored in the directory"""
+        return self.directory / key[:2] / f"{key}.pdf"
+
+    def get(self, key):
+        """gets the pdf cached under a key, or None"""
+        with self._lock:
+            pdf = self._entries.get(key)
+            if pdf is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pdf
+        if self.directory:
+            try:
+                pdf = self._path(key).read_bytes()
+            except OSError:
+                pass
+            else:
+                self._remember(key, pdf)
+                with self._lock:
+                    self.disk_hits += 1
+                return pdf
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, pdf):
+        """caches a pdf in memory, and on disk if there is a directory"""
+        self._remember(key, pdf)
+        if self.directory:
+            path = self._path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write then rename, so other workers never read half a file
+            with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as temp_file:
+                temp_file.write(pdf)
+            os.replace(temp_file.name, path)
+            if self.directory_max_bytes:
+                self._prune_directory()
+
+    def _remember(self, key, pdf):
+        """caches a pdf in memory, evicting the least recently used ones to make room"""
+        if len(pdf) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = pdf
+            self._size += len(pdf)
+            while self._size > self.max_bytes:
+                self._size -= len(self._entries.popitem(last=False)[1])
+
+    def _prune_directory(self):
+        """deletes the oldest files in the directory until it fits its size limit"""
+        files = []
+        for path in self.directory.glob("*/*.pdf"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.directory_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size -= file_size
+
+    def clear(self):
+        """empties the in-memory cache and resets its counters, the directory is left alone"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """gets the cache's size and hit/miss counters"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits,
+                    "disk_hits": self.disk_hits, "misses": self.misses}
+
+PDF_CACHE = PdfCache(
+    max_bytes=int(os.environ.get("PDF_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    directory=os.environ.get("PDF_CACHE_DIR"),
+    directory_max_bytes=int(os.environ.get("PDF_CACHE_DIR_MAX_BYTES", 0)) or None,
+)
@@ -0,0 +1,80 @@
+"""Module that checks decklists for the JSON API without writing their sheets"""
+
+import os
+from card_resolver import CardResolver
+from decklist import Decklist
+from decklist_parser import parse_decklist
+from exceptions import DeckError
+from format_rules import rules
+
+# most decklists one request can check
+VALIDATE_MAX_DECKLISTS = int(os.environ.get("VALIDATE_MAX_DECKLISTS", 5000))
+# decklists whose cards are resolved together before checking them one by one
+RESOLVE_BATCH_SIZE = 200
+
+def written(card):
+    """gets what was written on the decklist for a card"""
+    return {"name": card.name, "setCode": card.set_code,
+            "collectorNumber": card.collector_number}
+
+def card_details(card):
+    """gets what a card was written as and what it resolved to"""
+    details = {"quantity": card.quantity, "written": written(card), "resolved": card.resolved}
+    if card.resolved:
+        record = card.to_record()
+        formats = rules().card_formats(record)
+        details.update({
+            "name": record.name, "setCode": record.set_code,
+            "collectorNumber": record.collector_number, "supertype": record.supertype,
+            "regulationMark": record.regulation_mark, "standardLegal": "standard" in formats,
+            "expandedLegal": "expanded" in formats, "formats": formats
+        })
+    return details
+
+def validate(text):
+    """checks one decklist, returns its cards, legality and errors"""
+    decklist = Decklist(deck=text, strict=False)
+    errors = [{"type": "line", "message": message} for message in decklist.line_errors]
+    errors.extend({"type": "card", "message": error.message,
+                   "card": written(error.card) if error.card else None}
+                  for error in decklist.card_errors)
+    try:
+        decklist.get_legalities()
+    except DeckError as error:
+        errors.extend({"type": "deck", "message": message} for message in error.messages)
+    # a card that couldn't be found might not be legal, so the list can't be either
+    complete = not decklist.line_errors and not decklist.card_errors
+    return {
+        "valid": not errors,
+        "standard": complete and decklist.legality["standard"],
+        "expanded": complete and decklist.legality["expanded"],
+        "formats": {format_id: complete and legal
+                    for format_id, legal in decklist.legality.items()},
+        "cards": [card_details(card) for card in decklist.cards],
+        "errors": errors,
+    }
+
+def validate_many(texts):
+    """checks many decklists, resolving the cards they share once"""
+    for start in range(0, len(texts), RESOLVE_BATCH_SIZE):
+        # fills the card cache, each list below then resolves without its own query
+        cards = [card for text in texts[start:start + RESOLVE_BATCH_SIZE]
+                 for card in parse_decklist(text)[0]]
+        CardResolver().resolve_many(cards)
+    return [validate(text) for text in texts]
+
+def read_decklist(entry):
+    """gets the decklist text from a string or an object with a decklist field"""
+    if isinstance(entry, dict):
+        entry = entry.get("decklist")
+    if not isinstance(entry, str):
+        raise ValueError("Each decklist must be a string or an object with a decklist string")
+    return entry
+
+def validate_request(data):
+    """checks the decklist or list of decklists in a request, answering in the same shape"""
+    if isinstance(data, list):
+        if len(data) > VALIDATE_MAX_DECKLISTS:
+            raise ValueError(f"At most {VALIDATE_MAX_DECKLISTS} decklists can be checked at once")
+        return validate_many([read_decklist(entry) for entry in data])
+    return validate(read_decklist(data))
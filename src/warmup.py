@@ -0,0 +1,79 @@
+"""Module that loads what making sheets needs before the first request does
+
+Heavy libraries are imported where they're first used, so a worker that only renders pages
+never loads them. Set WARMUP=1 to load them when the site starts instead, so the first sheet
+isn't slower than the rest. With a server that imports the app before forking its workers
+(gunicorn --preload), the workers start out warm.
+"""
+
+import logging
+import os
+import time
+from io import BytesIO
+import card_api
+import card_database
+import card_snapshot
+import metrics
+from decklist import add_sheet, blank_sheet
+
+WARMUP_ENABLED = os.environ.get("WARMUP") == "1"
+
+def warm_pdf():
+    """imports the pdf libraries and reads the blank sheet"""
+    blank_sheet()
+
+def warm_fonts():
+    """draws a throwaway overlay onto a sheet, loading the fonts and code sheets are written with"""
+    # pylint: disable=import-outside-toplevel
+    from pypdf import PdfReader, PdfWriter
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    # pylint: enable=import-outside-toplevel
+    packet = BytesIO()
+    my_canvas = canvas.Canvas(packet, pagesize=letter)
+    my_canvas.setFont("Helvetica", 9)
+    my_canvas.drawString(0, 0, '✓')
+    my_canvas.save()
+    output = PdfWriter()
+    add_sheet(output, PdfReader(packet).pages[0])
+    output.write(BytesIO())
+
+def warm_database():
+    """loads the card snapshot if it's enabled, otherwise opens this thread's connection"""
+    if card_snapshot.SNAPSHOT:
+        card_snapshot.SNAPSHOT.get()
+    else:
+        card_database.read("SELECT 1 FROM cards LIMIT 1")
+
+def warm_api():
+    """imports the card API's sdk and reads the API key"""
+    card_api.configure()
+
+WARMUP_STEPS = {
+    "pdf": warm_pdf,
+    "fonts": warm_fonts,
+    "database": warm_database,
+    "api": warm_api,
+}
+# what processes that only write sheets need
+RENDER_STEPS = ("pdf", "fonts")
+
+def warmup(steps=tuple(WARMUP_STEPS)):
+    """runs warmup steps by name, returns how many seconds each took"""
+    timings = {}
+    for step in steps:
+        started = time.perf_counter()
+        try:
+            WARMUP_STEPS[step]()
+        except Exception: # pylint: disable=broad-exception-caught
+            # whatever failed here fails again on first use, with the request to show for it
+            logging.exception("Warmup step %s failed", step)
+        timings[step] = time.perf_counter() - started
+        metrics.STARTUP_SECONDS.set(timings[step], step=step)
+    logging.info("Warmed up in %.3fs (%s)", sum(timings.values()),
+                 ", ".join(f"{step} {seconds:.3f}s" for step, seconds in timings.items()))
+    return timings
+
+def warm_renderer():
+    """warms up a process that writes sheets, for use as a pool's initializer"""
+    warmup(RENDER_STEPS)
@@ -2,12 +2,44 @@
 
 from pathlib import Path
 from io import BytesIO
+import csv
 import logging
-from flask import Flask, render_template, request, send_file
+import time
+from flask import Flask, Response, g, jsonify, render_template, request, send_file
+from bulk import read_rows, stream_zip
 from decklist import Decklist
 from exceptions import DeckError
+from pages import site_context
+from pdf_cache import PDF_CACHE
+from validation import validate_request
+from warmup import WARMUP_ENABLED, warmup
+import metrics
 
 app = Flask(__name__)
+if WARMUP_ENABLED:
+    warmup()
+
+@app.before_request
+def start_request():
+    """starts timing, and profiling if this request is sampled"""
+    g.started = time.perf_counter()
+    g.profiler = metrics.start_profile()
+
+@app.after_request
+def finish_request(response):
+    """records how long the request took, and keeps its profile if it was slow"""
+    seconds = time.perf_counter() - g.started
+    endpoint = request.endpoint or "unknown"
+    metrics.REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+    if g.profiler:
+        metrics.finish_profile(g.profiler, endpoint, seconds)
+    return response
+
+@app.route('/metrics')
+def render_metrics():
+    """renders the counters and timings for prometheus to scrape"""
+    metrics.update_cache_stats()
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/favicon.ico')
 def favicon():
@@ -19,21 +51,8 @@ def favicon():
 @app.route('/')
 def render_site(warnings=None, name=None, player_id=None, birthday=None, decklist=None):
     """renders the homepage"""
-
-    title = "Concealed Cards"
-    if app.debug:
-        title += " β"
-    description = "Concealed Cards fills out Pokémon TCG deck registration sheets so you don't"\
-                  "have to."
-    favicon_alt = "A simplified graphic of a water energy in front of two face-down cards."
-    error_messages = None
-    if warnings:
-        error_messages = "\r\n".join(warnings)
-    if not decklist:
-        decklist = ""
-    return render_template('site.html', title=title, description=description,
-                           favicon_alt=favicon_alt, error_messages=error_messages, name=name,
-                           id=player_id, birthday=birthday, decklist=decklist)
+    return render_template('site.html', **site_context(app.debug, warnings, name, player_id,
+                                                       birthday, decklist))
 
 @app.route('/generate_decklist', methods=['POST'])
 def generate_decklist():
@@ -48,13 +67,43 @@ def generate_decklist():
                             player_id=player_id,
                             birthday=player_birthday,
                             deck=deck_list)
-        decklist_file = BytesIO(decklist_data.write())
+        # the same list is often submitted again to fix a typo or download it again
+        cache_key = decklist_data.cache_key()
+        decklist_pdf = PDF_CACHE.get(cache_key)
+        if decklist_pdf is None:
+            decklist_pdf = decklist_data.write()
+            PDF_CACHE.put(cache_key, decklist_pdf)
+        decklist_file = BytesIO(decklist_pdf)
         return send_file(decklist_file, mimetype='application/pdf',
                          download_name='Deck Registration Sheet.pdf')
     except DeckError as error:
         return render_site(warnings=error.messages, name=player_name, player_id=player_id,
                            birthday=player_birthday, decklist=deck_list)
 
+@app.route('/generate_decklists', methods=['POST'])
+def generate_decklists():
+    """generates decklists for every player in an uploaded csv or json file"""
+    players = request.files['players']
+    try:
+        rows = read_rows(players.read(), players.filename or "")
+    except (ValueError, csv.Error) as error:
+        return Response(f"Couldn't read players: {error}", status=400, mimetype='text/plain')
+    merged = request.form.get('layout') == 'merged'
+    return Response(stream_zip(rows, merged=merged), mimetype='application/zip',
+                    headers={'Content-Disposition':
+                             'attachment; filename="Deck Registration Sheets.zip"'})
+
+@app.route('/api/validate', methods=['POST'])
+def validate_decklists():
+    """checks a decklist or a list of decklists sent as json, without writing any sheets"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return jsonify(error="Request body must be JSON"), 400
+    try:
+        return jsonify(validate_request(data))
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     app.run(debug=True)
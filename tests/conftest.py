@@ -0,0 +1,72 @@
+"""Shared setup for the tests, run with python -m pytest from the repository root
+
+The modules under test read where cards.db is when they're imported, so this points them at a
+database of the tests' own, made by tools/import_cards.py from API-shaped cards like a real one,
+before any test module imports them.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).parents[1].resolve()
+DATABASE_DIR = Path(tempfile.mkdtemp(prefix="concealedcards-tests-"))
+os.environ["CARDS_DB"] = str(DATABASE_DIR / "cards.db")
+# no API cache, and an API that can't be reached, so a lookup that goes there fails fast
+os.environ["CARD_API_CACHE"] = ""
+os.environ["POKEMONTCG_IO_ENDPOINT"] = "http://127.0.0.1:9"
+for variable in ("CARDS_DB_SNAPSHOT", "CARDS_DB_IMMUTABLE"):
+    os.environ.pop(variable, None)
+sys.path[:0] = [str(ROOT / "src"), str(ROOT / "tools")]
+# pylint: disable=wrong-import-position
+import card_database
+import import_cards
+from card_cache import CARD_CACHE
+# pylint: enable=wrong-import-position
+
+def api_card(name, set_code, number, supertype, regulation_mark=None, standard=True,
+             expanded=True):
+    """makes a card shaped like the ones the API returns and the importer reads"""
+    return {"name": name, "number": number, "supertype": supertype,
+            "regulationMark": regulation_mark,
+            "legalities": {"standard": "Legal" if standard else None,
+                           "expanded": "Legal" if expanded else None},
+            "set": {"id": set_code.lower(), "ptcgoCode": set_code}}
+
+# basic energy is saved under the set it was printed in, never under ENERGY
+CARDS = [
+    api_card("Iono", "PAL", "185", "Trainer", "G"),
+    api_card("Iono", "PAL", "254", "Trainer", "G"),
+    api_card("Boss's Orders", "PAL", "172", "Trainer", "G"),
+    api_card("Reversal Energy", "PAL", "192", "Energy", "G"),
+    api_card("Charizard ex", "OBF", "125", "Pokémon", "G"),
+    api_card("Charizard ex", "OBF", "223", "Pokémon", "G"),
+    api_card("Charmander", "PAF", "7", "Pokémon", "G"),
+    api_card("Pidgeot ex", "OBF", "164", "Pokémon", "G"),
+    api_card("Radiant Charizard", "CRZ", "20", "Pokémon", "F"),
+    api_card("Mew", "SVP", "53", "Pokémon", "G"),
+    api_card("Professor Sycamore", "BKP", "107", "Trainer", standard=False),
+    api_card("Lysandre's Trump Card", "PHF", "99", "Trainer", standard=False, expanded=False),
+    api_card("Grass Energy", "SVE", "1", "Energy"),
+    api_card("Psychic Energy", "SVE", "5", "Energy"),
+]
+
+def pytest_sessionstart(session): # pylint: disable=unused-argument
+    """makes the tests' card database"""
+    con = card_database.connect(card_database.DATABASE_PATH)
+    card_database.migrate(con)
+    import_cards.sync(con, CARDS, {})
+    con.close()
+
+def pytest_sessionfinish(session): # pylint: disable=unused-argument
+    """removes the tests' card database"""
+    card_database.close_reader()
+    shutil.rmtree(DATABASE_DIR, ignore_errors=True)
+
+@pytest.fixture(autouse=True)
+def empty_card_cache():
+    """starts every test without cards resolved by an earlier one"""
+    CARD_CACHE.clear()
@@ -0,0 +1,81 @@
+"""Tests for resolving a deck's cards at once against the card database"""
+
+import pytest
+import card_database
+import card_snapshot
+from card_cache import CARD_CACHE
+from card_resolver import CardResolver
+from decklist_parser import parse_decklist
+
+# lines that resolve locally, by every key and the name matcher
+FOUND = [
+    "4 Iono PAL 185",
+    "1 Iono PAL 0254",
+    "2 Boss's Orders PAL 999",
+    "3 Iono PAL",
+    "1 Radiant Charizard",
+    "2 Bosss Orders PAL 172",
+    "1 Pidgeoot ex OBF",
+    "4 Grass Energy",
+    "2 Basic {P} Energy SVE 5",
+    "1 Mew PR-SV 53",
+    "1 Professor Sycamore BKP 107",
+    "1 Charizrd ex OBF 223",
+]
+# lines that are left for the API
+MISSING = [
+    "1 Charizard ex OBF 999",
+    "1 Pidgeoot ex OBF 26",
+    "1 Nonexistent Card XYZ 1",
+]
+
+@pytest.fixture(params=[False, True], ids=["database", "snapshot"])
+def snapshot(request, monkeypatch):
+    """answers lookups from cards.db, then from a snapshot of it"""
+    if request.param:
+        monkeypatch.setattr(card_snapshot, "SNAPSHOT", card_snapshot.SnapshotHolder())
+
+def parse(lines):
+    """parses lines one card each"""
+    cards, errors = parse_decklist(lines)
+    assert not errors and len(cards) == len(lines)
+    return cards
+
+@pytest.mark.usefixtures("snapshot")
+def test_same_as_lookup_from_database():
+    """resolves each card to what looking it up on its own would"""
+    cards = parse(FOUND)
+    errors, missing, _ = CardResolver().resolve_locally(cards, card_snapshot.database_version())
+    assert not errors and not missing
+    for card, line in zip(cards, FOUND):
+        alone = parse([line])[0]
+        alone.lookup_from_database()
+        assert card.record is alone.record, line
+
+@pytest.mark.usefixtures("snapshot")
+def test_missing_cards_left_for_api():
+    """leaves cards it can't find, or can only find at another printing, for the API"""
+    cards = parse(FOUND + MISSING)
+    errors, missing, _ = CardResolver().resolve_locally(cards, card_snapshot.database_version())
+    assert not errors
+    assert [f"{card.quantity} {card.name} {card.set_code} {card.collector_number}"
+            for card in missing] == MISSING
+    assert all(not card.resolved for card in missing)
+
+def test_cached_until_database_changes(monkeypatch):
+    """answers repeats from the cache, until cards.db changes under it"""
+    monkeypatch.setattr(card_snapshot.VERSION, "check_seconds", 0)
+
+    def standard_legal():
+        card = parse(["1 Iono PAL 185"])[0]
+        assert not CardResolver().resolve_many([card])
+        return card.record.standard_legal
+
+    assert standard_legal()
+    assert standard_legal() and CARD_CACHE.stats()["hits"] == 1
+    update = "UPDATE cards SET isStandardLegal = ? WHERE setCode = 'PAL' AND collNo = 185"
+    card_database.write(update, (False,))
+    try:
+        assert not standard_legal()
+    finally:
+        card_database.write(update, (True,))
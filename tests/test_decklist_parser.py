@@ -0,0 +1,98 @@
+"""Tests for reading decklists, which never looks anything up"""
+
+from decklist_parser import parse_decklist
+
+def read(text):
+    """gets (quantity, name, set code, collector number) of each card parsed from a list"""
+    cards, errors = parse_decklist(text)
+    assert not errors
+    return [(card.quantity, card.name, card.set_code, card.collector_number) for card in cards]
+
+def test_live_export():
+    """reads a list exported from Pokémon TCG Live, section headers and all"""
+    assert read("Pokémon: 2\n"
+                "2 Charizard ex OBF 125\n"
+                "\n"
+                "Trainer: 4\n"
+                "4 Iono PAL 185\n"
+                "\n"
+                "Energy: 3\n"
+                "3 Basic {P} Energy SVE 5\n"
+                "\n"
+                "Total Cards: 9\n") == [
+        (2, "Charizard ex", "OBF", "125"),
+        (4, "Iono", "PAL", "185"),
+        (3, "Psychic Energy", "ENERGY", "5"),
+    ]
+
+def test_section_headers():
+    """reads headers written by other sites, which don't start with a quantity"""
+    for header in ("Pokemon - 1", "Pokémon (1)", "POKEMON: 1", "Pokémons"):
+        cards, errors = parse_decklist(f"{header}\n1 Charizard ex OBF 125")
+        assert len(cards) == 1 and not errors
+
+def test_lines_or_text():
+    """reads a list given as text or as lines the same way"""
+    text = "4 Iono PAL 185\n2 Charizard ex OBF 125"
+    assert read(text) == read(text.splitlines())
+
+def test_ph_suffix():
+    """drops the PH Live adds to cards it shows as placeholders"""
+    assert read("1 Charizard ex OBF 125 PH") == [(1, "Charizard ex", "OBF", "125")]
+
+def test_energy_symbols():
+    """writes out the energy symbols Live uses, and puts basic energy under ENERGY"""
+    assert read("1 Basic {G} Energy SVE 1\n1 Basic {D} Energy SVE 7\n1 Metal Energy") == [
+        (1, "Grass Energy", "ENERGY", "1"),
+        (1, "Darkness Energy", "ENERGY", "7"),
+        (1, "Metal Energy", "ENERGY", None),
+    ]
+
+def test_special_energy():
+    """leaves energy that isn't basic under the set it was written with"""
+    assert read("2 Reversal Energy PAL 192") == [(2, "Reversal Energy", "PAL", "192")]
+
+def test_promos():
+    """turns the promo set codes Limitless writes into the ones the database has"""
+    assert read("1 Mew PR-SV 53\n1 Pikachu PR-SW 12") == [
+        (1, "Mew", "SVP", "53"),
+        (1, "Pikachu", "PR", "SW012"),
+    ]
+
+def test_line_without_number():
+    """reads the last word of a line without a collector number as its set code"""
+    assert read("4 Professor's Research") == [(4, "Professor's", "RESEARCH", None)]
+
+def test_unreadable_lines():
+    """reports lines with a quantity that can't be read, and skips everything else"""
+    cards, errors = parse_decklist("4\n2 Charizard ex OBF 125\nsome notes\n1 Iono")
+    assert [card.name for card in cards] == ["Charizard ex"]
+    assert errors == ["Couldn't read line: 4", "Couldn't read line: 1 Iono"]
+
+def test_merge_printings():
+    """merges repeats of a printing, whatever zeros its number was written with"""
+    assert read("2 Charizard ex OBF 125\n1 Charizard ex OBF 0125") == [
+        (3, "Charizard ex", "OBF", "125"),
+    ]
+
+def test_keep_pokemon_printings_apart():
+    """keeps different printings of a Pokémon apart, they're written on separate lines"""
+    assert read("Pokémon: 3\n2 Charizard ex OBF 125\n1 Charizard ex OBF 223") == [
+        (2, "Charizard ex", "OBF", "125"),
+        (1, "Charizard ex", "OBF", "223"),
+    ]
+
+def test_merge_trainers_and_energy_by_name():
+    """merges printings of a trainer or energy under its section header by name"""
+    assert read("Trainer: 4\n2 Iono PAL 185\n2 Iono PAL 254\n"
+                "Energy: 4\n2 Basic {G} Energy SVE 1\n2 Grass Energy") == [
+        (4, "Iono", "PAL", "185"),
+        (4, "Grass Energy", "ENERGY", "1"),
+    ]
+
+def test_without_headers_merge_by_printing():
+    """merges only repeats of a printing when there's no header to say what a card is"""
+    assert read("2 Iono PAL 185\n2 Iono PAL 254") == [
+        (2, "Iono", "PAL", "185"),
+        (2, "Iono", "PAL", "254"),
+    ]
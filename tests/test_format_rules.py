@@ -0,0 +1,150 @@
+"""Tests for checking decks against every format's rules at once"""
+
+from card_info import CardInfo, intern_record
+from decklist import Decklist
+from format_rules import ANY, Format, FormatRules
+
+STANDARD = Format("standard", "Standard", 60, 4, "standard")
+EXPANDED = Format("expanded", "Expanded", 60, 4, "expanded")
+SINGLES = Format("singles", "Expanded Singles", 60, 1, "expanded")
+# a format that only allows what its rows make legal
+THEME = Format("theme", "Theme Decks", 60, 4, None)
+
+IONO = intern_record("Iono", "PAL", "185", "G", "Trainer", True, True)
+IONO_FULL_ART = intern_record("Iono", "PAL", "254", "G", "Trainer", True, True)
+BOSS = intern_record("Boss's Orders", "PAL", "172", "G", "Trainer", True, True)
+CHARIZARD = intern_record("Charizard ex", "OBF", "125", "G", "Pokémon", True, True)
+RADIANT = intern_record("Radiant Charizard", "CRZ", "20", "F", "Pokémon", True, True)
+SYCAMORE = intern_record("Professor Sycamore", "BKP", "107", "NA", "Trainer", False, True)
+REVERSAL = intern_record("Reversal Energy", "PAL", "192", "G", "Energy", True, True)
+# basic energy saved by the importer, with and without Basic, and by an API lookup of a line
+GRASS = intern_record("Grass Energy", "SVE", "1", "NA", "Energy", True, True)
+BASIC_FIRE = intern_record("Basic Fire Energy", "SVE", "2", "NA", "Energy", True, True)
+PSYCHIC = intern_record("Psychic Energy", "ENERGY", "5", "NA", "Energy", True, True)
+
+def card(quantity, record):
+    """makes a card resolved to a record"""
+    resolved = CardInfo(quantity=quantity, name=record.name, set_code=record.set_code,
+                        collector_number=record.collector_number)
+    resolved.update_from_record(record)
+    return resolved
+
+def make_rules(formats=(STANDARD, EXPANDED), legality=(), bans=()):
+    """makes rules from rows of the format tables"""
+    return FormatRules(formats, legality, bans)
+
+def deck(*cards):
+    """makes a 60 card deck, filled up with grass energy"""
+    return [*cards, card(60 - sum(each.quantity for each in cards), GRASS)]
+
+def test_legal_everywhere():
+    """passes a deck every card of which is legal in every format"""
+    check = make_rules().check(deck(card(4, IONO), card(4, BOSS), card(3, CHARIZARD)))
+    assert check.formats() == {"standard": True, "expanded": True}
+    assert not check.messages(("standard", "expanded"))
+
+def test_card_legality():
+    """follows the legality the importer and API gave each card"""
+    check = make_rules().check(deck(card(1, SYCAMORE)))
+    assert check.formats() == {"standard": False, "expanded": True}
+    assert check.messages(("standard",)) == [
+        "Professor Sycamore BKP 107 is not legal in standard."]
+    assert not check.messages(("standard", "expanded"))
+
+def test_copy_limit_across_printings():
+    """counts every printing of a card towards its copy limit"""
+    check = make_rules().check(deck(card(3, IONO), card(2, IONO_FULL_ART)))
+    assert check.formats() == {"standard": False, "expanded": False}
+    assert check.messages(("standard", "expanded")) == [
+        "Deck contains 5 copies of Iono, maximum is 4."]
+
+def test_copy_limit_special_energy():
+    """limits energy that isn't basic like any other card"""
+    check = make_rules().check(deck(card(5, REVERSAL)))
+    assert not check.legal("standard")
+
+def test_basic_energy_any_number():
+    """allows any number of basic energy, whatever set code it's saved under"""
+    for record in (GRASS, BASIC_FIRE, PSYCHIC):
+        check = make_rules().check([card(60, record)])
+        assert check.formats() == {"standard": True, "expanded": True}, record
+        assert not check.copies, record
+
+def test_copy_limit_per_format():
+    """checks each format's own copy limit"""
+    check = make_rules((STANDARD, EXPANDED, SINGLES)).check(deck(card(2, BOSS)))
+    assert check.formats() == {"standard": True, "expanded": True, "singles": False}
+    assert check.messages(("singles",)) == [
+        "Deck contains 2 copies of Boss's Orders, maximum is 1."]
+
+def test_deck_size():
+    """needs exactly the format's deck size"""
+    check = make_rules().check([card(4, IONO), card(55, GRASS)])
+    assert check.formats() == {"standard": False, "expanded": False}
+    assert check.messages(("standard",)) == ["Deck contains 59 cards, must be 60."]
+
+def test_rotate_by_mark():
+    """rules out a regulation mark in one format, leaving the others alone"""
+    rules = make_rules(legality=[("standard", ANY, "F", False)])
+    check = rules.check(deck(card(1, RADIANT)))
+    assert check.formats() == {"standard": False, "expanded": True}
+    assert rules.card_formats(RADIANT) == ["expanded"]
+    assert rules.card_formats(CHARIZARD) == ["standard", "expanded"]
+
+def test_most_specific_row_wins():
+    """matches rows by set and mark, then set, then mark, then neither"""
+    rules = make_rules(legality=[("standard", ANY, ANY, False), ("standard", ANY, "G", True),
+                                 ("standard", "PAL", ANY, False),
+                                 ("standard", "PAL", "G", True)])
+    assert rules.card_formats(IONO) == ["standard", "expanded"]
+    assert rules.card_formats(REVERSAL) == ["standard", "expanded"]
+    assert rules.card_formats(CHARIZARD) == ["standard", "expanded"]
+    assert rules.card_formats(RADIANT) == ["expanded"]
+    rules = make_rules(legality=[("standard", "PAL", ANY, False), ("standard", ANY, "G", True)])
+    assert rules.card_formats(IONO) == ["expanded"]
+
+def test_rows_only_narrow_card_legality():
+    """never makes a card legal in a format that follows its legality when the card says no"""
+    rules = make_rules(legality=[("standard", ANY, ANY, True), ("standard", "BKP", ANY, True)])
+    assert rules.card_formats(SYCAMORE) == ["expanded"]
+
+def test_format_without_fallback():
+    """allows only what its rows make legal in a format that doesn't follow card legality"""
+    rules = make_rules((STANDARD, THEME), legality=[("theme", "BKP", ANY, True),
+                                                    ("theme", "SVE", ANY, True)])
+    assert rules.card_formats(SYCAMORE) == ["theme"]
+    assert rules.card_formats(IONO) == ["standard"]
+    assert rules.check(deck(card(1, SYCAMORE))).formats() == {"standard": False, "theme": True}
+
+def test_bans_by_normalized_name():
+    """bans every printing of a card, however the ban's apostrophes were typed"""
+    rules = make_rules(bans=[("expanded", "Boss’s Orders"), ("unknown", "Iono")])
+    check = rules.check(deck(card(1, BOSS), card(1, IONO)))
+    assert check.formats() == {"standard": True, "expanded": False}
+    assert check.messages(("expanded",)) == ["Boss's Orders PAL 172 is not legal in expanded."]
+
+def test_unresolved_cards_skipped():
+    """leaves cards that couldn't be found to the resolver's errors"""
+    missing = CardInfo(quantity=4, name="Missing", set_code="XYZ", collector_number="1")
+    check = make_rules().check([*deck(card(4, IONO)), missing])
+    assert check.formats() == {"standard": True, "expanded": True}
+    assert check.total == 60
+
+def test_missing_formats():
+    """treats a format that isn't in the tables as one no deck is legal in"""
+    check = make_rules((STANDARD,)).check(deck(card(1, SYCAMORE)))
+    assert not check.legal("expanded")
+    assert check.messages(("standard", "expanded")) == [
+        "Professor Sycamore BKP 107 is not legal in standard."]
+    assert check.messages(("expanded",)) == [
+        "There are no formats to check the deck against."]
+
+def test_imported_basic_energy():
+    """passes decks full of basic energy the importer saved under the set it was printed in"""
+    for energy in ("Energy: 52\n44 Basic {G} Energy SVE 1\n4 Grass Energy\n"
+                   "4 Psychic Energy SVE 5", "48 Grass Energy\n4 Basic {P} Energy SVE 5"):
+        decklist = Decklist(deck=f"4 Iono PAL 185\n4 Boss's Orders PAL 172\n{energy}")
+        assert {card.get_set_code for card in decklist.deck if card.get_supertype == "Energy"} \
+            == {"SVE"}
+        decklist.get_legalities()
+        assert decklist.legality == {"standard": True, "expanded": True}
@@ -0,0 +1,36 @@
+"""Writes deck registration sheets for every player in a csv or json file
+
+Rows need the columns playerName, playerId, playerBirthday (YYYY-MM-DD) and decklist. Output
+ending in .pdf gets every sheet in one pdf, anything else gets a zip with a pdf per player.
+Rows that fail are listed in errors.json inside the zip, or next to the pdf.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1].resolve() / "src"))
+from bulk import BULK_WORKERS, build_merged, error_report, read_rows, stream_zip # pylint: disable=wrong-import-position
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("players", type=Path, help="csv or json file of players")
+    parser.add_argument("output", type=Path, help="zip or pdf file to write")
+    parser.add_argument("--workers", type=int, default=BULK_WORKERS,
+                        help="processes to build sheets with (default: %(default)s)")
+    args = parser.parse_args()
+    rows = read_rows(args.players.read_text(encoding="utf-8-sig"), args.players.name,
+                     max_rows=None)
+    if args.output.suffix.lower() == ".pdf":
+        pdf, errors = build_merged(rows, args.workers)
+        args.output.write_bytes(pdf)
+        errors_path = args.output.with_name(args.output.stem + " errors.json")
+        errors_path.write_text(error_report(rows, errors), encoding="utf-8")
+        print(f"Wrote {len(rows) - len(errors)} sheets to {args.output}, {len(errors)} rows "
+              f"failed, see {errors_path}")
+    else:
+        with open(args.output, "wb") as writer:
+            for chunk in stream_zip(rows, workers=args.workers):
+                writer.write(chunk)
+        print(f"Wrote {args.output}, failed rows are listed in its errors.json")
@@ -0,0 +1,164 @@
+"""Serves a local stand-in for the pokemontcg.io card API, for developing and load testing offline
+
+Answers GET /v2/cards searches the way the site sends them (!name:"..." set.ptcgoCode:"..."
+number:...) from the cards in cards.db, or from JSON dumps like tools/import_cards.py reads.
+Point the site at it with POKEMONTCG_IO_ENDPOINT=http://127.0.0.1:8765/v2. Every response
+waits --latency seconds, give or take --jitter, and --error-rate of them fail with a 500.
+"""
+
+import argparse
+import json
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).parents[1].resolve() / "src"))
+from card_database import DATABASE_PATH # pylint: disable=wrong-import-position
+from import_cards import read_cards, read_sets # pylint: disable=wrong-import-position
+
+# terms look like name:Pikachu, !name:"Professor's Research" or set.ptcgoCode:"SVI"
+QUERY_TERM_PATTERN = re.compile(r'(!?)([\w.]+):(?:"([^"]*)"|(\S+))')
+DEFAULT_PAGE_SIZE = 250
+
+def database_cards(path):
+    """reads every card in a card database, shaped like the API's cards"""
+    con = sqlite3.connect(Path(path).as_uri() + "?mode=ro", uri=True)
+    rows = con.execute("SELECT name, setCode, collNo, regMark, type, isStandardLegal, "
+                       "isExpandedLegal FROM cards ORDER BY rowid DESC").fetchall()
+    con.close()
+    for name, set_code, collector_number, regulation_mark, supertype, standard, expanded in rows:
+        yield {
+            "id": f"{set_code.lower()}-{collector_number}",
+            "name": name,
+            "number": str(collector_number),
+            "supertype": supertype,
+            "regulationMark": None if regulation_mark == "NA" else regulation_mark,
+            "legalities": {"unlimited": "Legal", "standard": "Legal" if standard else None,
+                           "expanded": "Legal" if expanded else None},
+            "set": {"id": set_code.lower(), "name": set_code, "ptcgoCode": set_code},
+        }
+
+def complete_card(card, sets):
+    """fills in what the sdk needs from a card that a dump or the database left out"""
+    card_set = {"images": {"symbol": "", "logo": ""}, "legalities": {"unlimited": "Legal"},
+                "name": "", "printedTotal": 0, "ptcgoCode": None, "releaseDate": "",
+                "series": "", "total": 0, "updatedAt": "",
+                **sets.get(card["set"]["id"], {}), **card["set"]}
+    return {"images": {"small": "", "large": ""}, "legalities": {"unlimited": "Legal"},
+            **card, "set": card_set}
+
+def field_value(card, field):
+    """gets a dotted field like set.ptcgoCode from a card, lowercased for comparing"""
+    value = card
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return None if value is None else str(value).lower()
+
+class CardIndex:
+    """Cards to search, newest set first, indexed by name and number"""
+
+    def __init__(self, cards):
+        self.cards = sorted(cards, key=lambda card: card["set"]["releaseDate"], reverse=True)
+        self.by_field = {"name": {}, "number": {}}
+        for card in self.cards:
+            for field, index in self.by_field.items():
+                index.setdefault(field_value(card, field), []).append(card)
+
+    def search(self, query):
+        """gets the cards matching every term of a search, exact matches only"""
+        terms = [(field, (quoted or bare).lower())
+                 for _, field, quoted, bare in QUERY_TERM_PATTERN.findall(query)]
+        cards = self.cards
+        for field, value in terms:
+            if field in self.by_field:
+                cards = self.by_field[field].get(value, [])
+                break
+        return [card for card in cards
+                if all(field_value(card, field) == value for field, value in terms)]
+
+def make_handler(index, latency, jitter, error_rate, verbose):
+    """makes a request handler answering searches from an index"""
+    # random.Random isn't shared safely between the server's threads
+    random_lock = threading.Lock()
+
+    class CardApiHandler(BaseHTTPRequestHandler):
+        """Answers card searches like the real API"""
+
+        def do_GET(self): # pylint: disable=invalid-name
+            """answers a search of /v2/cards"""
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            with random_lock:
+                delay = max(0, latency + random.uniform(-jitter, jitter))
+                failed = random.random() < error_rate
+            time.sleep(delay)
+            if url.path.rstrip("/") != "/v2/cards":
+                self.answer(404, {"error": {"message": "Not found", "code": 404}})
+            elif failed:
+                self.answer(500, {"error": {"message": "Stub error", "code": 500}})
+            else:
+                cards = index.search(params.get("q", ""))
+                page = int(params.get("page", 1))
+                page_size = int(params.get("pageSize", DEFAULT_PAGE_SIZE))
+                data = cards[(page - 1) * page_size:page * page_size]
+                self.answer(200, {"data": data, "page": page, "pageSize": page_size,
+                                  "count": len(data), "totalCount": len(cards)})
+
+        def answer(self, status, body):
+            """sends a json response"""
+            content = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args): # pylint: disable=redefined-builtin
+            """only logs requests with --verbose"""
+            if verbose:
+                super().log_message(format, *args)
+
+    return CardApiHandler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dumps", nargs="*", type=Path,
+                        help="card dump files or directories to serve instead of cards.db")
+    parser.add_argument("--sets", type=Path, help="dump of sets, for cards that don't embed one")
+    parser.add_argument("--database", default=DATABASE_PATH, type=Path,
+                        help="card database to serve without dumps (default: %(default)s)")
+    parser.add_argument("--host", default="127.0.0.1", help="(default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8765, help="(default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="seconds every response waits (default: %(default)s)")
+    parser.add_argument("--jitter", type=float, default=0,
+                        help="seconds latency varies by either way (default: %(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="share of requests answered with a 500 (default: %(default)s)")
+    parser.add_argument("--seed", type=int, help="seed for jitter and errors, to repeat a run")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    if args.dumps:
+        source = (card for dump in args.dumps for card in read_cards(dump))
+        card_sets = read_sets(args.sets) if args.sets else {}
+    else:
+        source = database_cards(args.database)
+        card_sets = {}
+    card_index = CardIndex(complete_card(card, card_sets) for card in source)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(
+        card_index, args.latency, args.jitter, args.error_rate, args.verbose))
+    print(f"Serving {len(card_index.cards)} cards on http://{args.host}:{args.port}/v2")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
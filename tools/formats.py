@@ -0,0 +1,150 @@
+"""Lists and edits the formats decks are checked against, and what's legal in them
+
+Legality is set by regulation mark, set code or both, so rotating standard is one command per
+mark. A format with a fallback follows the standard or expanded legality the importer and API
+give each card, and its rows can only rule cards out, ahead of the importer catching up. A
+format without one allows only what its rows make legal. Running sites pick changes up within
+CARDS_DB_SNAPSHOT_CHECK_SECONDS, like any other change to cards.db.
+
+    formats.py legal standard --mark F --no
+    formats.py add singles "Expanded Singles" --max-copies 1 --fallback expanded
+    formats.py ban singles "Lysandre's Trump Card"
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1].resolve() / "src"))
+from card_database import DATABASE_PATH, connect, migrate # pylint: disable=wrong-import-position
+from card_matcher import normalize_name # pylint: disable=wrong-import-position
+from format_rules import ANY, SHEET_FORMATS # pylint: disable=wrong-import-position
+
+def list_formats(con, _args):
+    """prints every format"""
+    for row in con.execute("SELECT id, name, deckSize, maxCopies, fallback, "
+                           "(SELECT count(*) FROM formatLegality WHERE format = formats.id), "
+                           "(SELECT count(*) FROM formatBans WHERE format = formats.id) "
+                           "FROM formats ORDER BY rowid"):
+        format_id, name, deck_size, max_copies, fallback, rules, bans = row
+        print(f"{format_id}: {name}, {deck_size} cards, {max_copies} copies, "
+              f"falls back to {fallback or 'nothing'}, {rules} legality rows, {bans} bans")
+
+def show_format(con, args):
+    """prints a format's legality rows and bans"""
+    check_format(con, args.format)
+    for set_code, regulation_mark, is_legal in con.execute(
+            "SELECT setCode, regMark, isLegal FROM formatLegality WHERE format = ? "
+            "ORDER BY setCode, regMark", (args.format,)):
+        print(f"set {set_code} mark {regulation_mark}: {'legal' if is_legal else 'not legal'}")
+    for (name,) in con.execute("SELECT name FROM formatBans WHERE format = ? ORDER BY name",
+                               (args.format,)):
+        print(f"banned: {name}")
+
+def add_format(con, args):
+    """adds a format, optionally with another format's rules"""
+    with con:
+        con.execute("INSERT INTO formats (id, name, deckSize, maxCopies, fallback) "
+                    "VALUES (?, ?, ?, ?, ?)", (args.format, args.name, args.deck_size,
+                                               args.max_copies, args.fallback))
+        if args.copy_from:
+            check_format(con, args.copy_from)
+            con.execute("INSERT INTO formatLegality SELECT ?, setCode, regMark, isLegal "
+                        "FROM formatLegality WHERE format = ?", (args.format, args.copy_from))
+            con.execute("INSERT INTO formatBans SELECT ?, name FROM formatBans WHERE format = ?",
+                        (args.format, args.copy_from))
+
+def remove_format(con, args):
+    """removes a format and its rules"""
+    check_format(con, args.format)
+    if args.format in SHEET_FORMATS:
+        sys.exit(f"'{args.format}' has a box on the registration sheet, it can't be removed")
+    with con:
+        for table, column in (("formatLegality", "format"), ("formatBans", "format"),
+                              ("formats", "id")):
+            con.execute(f"DELETE FROM {table} WHERE {column} = ?", (args.format,))
+
+def set_legality(con, args):
+    """sets or clears whether a set code and regulation mark are legal in a format"""
+    check_format(con, args.format)
+    key = (args.format, args.set_code, args.mark)
+    with con:
+        if args.legal == "clear":
+            con.execute("DELETE FROM formatLegality "
+                        "WHERE format = ? AND setCode = ? AND regMark = ?", key)
+        else:
+            con.execute("INSERT OR REPLACE INTO formatLegality "
+                        "(format, setCode, regMark, isLegal) VALUES (?, ?, ?, ?)",
+                        (*key, args.legal))
+
+def ban_cards(con, args):
+    """bans cards from a format by name"""
+    check_format(con, args.format)
+    for name in args.names:
+        if not con.execute("SELECT 1 FROM cards WHERE nameNorm = ?",
+                           (normalize_name(name),)).fetchone():
+            print(f"No card is named '{name}' yet, check the spelling", file=sys.stderr)
+    with con:
+        con.executemany("INSERT OR IGNORE INTO formatBans (format, name) VALUES (?, ?)",
+                        ((args.format, name) for name in args.names))
+
+def unban_cards(con, args):
+    """lifts bans on cards in a format"""
+    check_format(con, args.format)
+    with con:
+        con.executemany("DELETE FROM formatBans WHERE format = ? AND name = ?",
+                        ((args.format, name) for name in args.names))
+
+def check_format(con, format_id):
+    """exits if a format doesn't exist"""
+    if not con.execute("SELECT 1 FROM formats WHERE id = ?", (format_id,)).fetchone():
+        sys.exit(f"No format '{format_id}', see formats.py list")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default=DATABASE_PATH, type=Path,
+                        help="path to cards.db (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list every format").set_defaults(run=list_formats)
+    command = commands.add_parser("show", help="show a format's legality rows and bans")
+    command.add_argument("format")
+    command.set_defaults(run=show_format)
+    command = commands.add_parser("add", help="add a format")
+    command.add_argument("format", help="id decks are checked against it by")
+    command.add_argument("name")
+    command.add_argument("--deck-size", type=int, default=60, help="(default: %(default)s)")
+    command.add_argument("--max-copies", type=int, default=4, help="(default: %(default)s)")
+    command.add_argument("--fallback", choices=["standard", "expanded"],
+                         help="card legality the format follows, its rows can only rule cards "
+                              "out (default: none, only rows make cards legal)")
+    command.add_argument("--copy-from", help="format to copy legality rows and bans from")
+    command.set_defaults(run=add_format)
+    command = commands.add_parser("remove", help="remove a format and its rules")
+    command.add_argument("format")
+    command.set_defaults(run=remove_format)
+    command = commands.add_parser("legal", help="set what's legal by set code and mark")
+    command.add_argument("format")
+    command.add_argument("--set", dest="set_code", default=ANY,
+                         help="set code, or every set (default: %(default)s)")
+    command.add_argument("--mark", default=ANY,
+                         help="regulation mark, NA for none, or every mark (default: %(default)s)")
+    legality = command.add_mutually_exclusive_group(required=True)
+    legality.add_argument("--yes", dest="legal", action="store_const", const=True)
+    legality.add_argument("--no", dest="legal", action="store_const", const=False)
+    legality.add_argument("--clear", dest="legal", action="store_const", const="clear",
+                          help="remove the row, falling back to less specific ones")
+    command.set_defaults(run=set_legality)
+    for name, run, description in (("ban", ban_cards, "ban cards by name"),
+                                   ("unban", unban_cards, "lift bans on cards")):
+        command = commands.add_parser(name, help=description)
+        command.add_argument("format")
+        command.add_argument("names", nargs="+")
+        command.set_defaults(run=run)
+    args = parser.parse_args()
+    if not args.database.exists():
+        sys.exit(f"{args.database} does not exist, run initialize_database.py first")
+    con = connect(args.database)
+    migrate(con)
+    args.run(con, args)
+    con.close()
@@ -0,0 +1,94 @@
+"""Bulk loads card data from local JSON dumps into the card database
+
+Dumps hold cards shaped like the pokemontcgsdk Card objects the API returns, either as a list
+or as an API response with the list under "data". Cards from dumps that don't embed their set
+(like the pokemon-tcg-data repository's cards/en/<set id>.json) get it from --sets. Sets whose
+cards haven't changed since the last import are skipped unless --full is given.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1].resolve() / "src"))
+from card_database import DATABASE_PATH, UPSERT_CARD, connect, migrate # pylint: disable=wrong-import-position
+
+UPSERT_SET = "INSERT INTO cardSets (id, setCode, updatedAt, checksum, cardCount) "\
+             "VALUES (?, ?, ?, ?, ?) "\
+             "ON CONFLICT (id) DO UPDATE SET setCode=excluded.setCode, "\
+             "updatedAt=excluded.updatedAt, checksum=excluded.checksum, "\
+             "cardCount=excluded.cardCount"
+
+def read_cards(path):
+    """reads the cards in a dump file, or every .json file in a directory"""
+    paths = sorted(path.rglob("*.json")) if path.is_dir() else [path]
+    for dump in paths:
+        with open(dump, encoding="utf-8") as reader:
+            data = json.load(reader)
+        if isinstance(data, dict):
+            data = data.get("data", [])
+        for card in data:
+            # pokemon-tcg-data names its card files after the set they hold
+            card.setdefault("set", {"id": dump.stem})
+            yield card
+
+def read_sets(path):
+    """reads a dump of sets into a dictionary keyed by set id"""
+    with open(path, encoding="utf-8") as reader:
+        data = json.load(reader)
+    if isinstance(data, dict):
+        data = data.get("data", [])
+    return {card_set["id"]: card_set for card_set in data}
+
+def card_row(card, set_code):
+    """converts a card into a row of the cards table, the same way CardInfo.update_from_api does"""
+    legalities = card.get("legalities") or {}
+    return (card["name"], set_code, card["number"], card.get("regulationMark") or "NA",
+            card["supertype"], legalities.get("standard") == "Legal",
+            legalities.get("expanded") == "Legal")
+
+def sync(con, cards, sets, full=False):
+    """upserts every set that is new or changed, returns counts of what happened"""
+    counts = {"sets imported": 0, "sets unchanged": 0, "sets without a code": 0, "cards": 0}
+    by_set = defaultdict(list)
+    for card in cards:
+        by_set[card["set"]["id"]].append(card)
+    known = dict(con.execute("SELECT id, checksum FROM cardSets"))
+    for set_id, set_cards in sorted(by_set.items()):
+        card_set = {**sets.get(set_id, {}), **set_cards[0]["set"]}
+        set_code = card_set.get("ptcgoCode")
+        if not set_code:
+            # the site looks cards up by ptcgoCode, so a set without one can't be matched
+            counts["sets without a code"] += 1
+            continue
+        rows = sorted(card_row(card, set_code.strip().upper()) for card in set_cards)
+        checksum = hashlib.sha256(json.dumps(rows).encode("utf-8")).hexdigest()
+        if not full and known.get(set_id) == checksum:
+            counts["sets unchanged"] += 1
+            continue
+        with con:
+            con.executemany(UPSERT_CARD, rows)
+            con.execute(UPSERT_SET, (set_id, set_code, card_set.get("updatedAt"), checksum,
+                                     len(rows)))
+        counts["sets imported"] += 1
+        counts["cards"] += len(rows)
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dumps", nargs="+", type=Path, help="card dump files or directories")
+    parser.add_argument("--sets", type=Path, help="dump of sets, for cards that don't embed one")
+    parser.add_argument("--database", default=DATABASE_PATH, type=Path,
+                        help="path to cards.db (default: %(default)s)")
+    parser.add_argument("--full", action="store_true", help="re-import sets that haven't changed")
+    args = parser.parse_args()
+    con = connect(args.database)
+    migrate(con)
+    all_cards = (card for dump in args.dumps for card in read_cards(dump))
+    results = sync(con, all_cards, read_sets(args.sets) if args.sets else {}, args.full)
+    con.close()
+    print(", ".join(f"{count} {label}" for label, count in results.items()))
@@ -1,15 +1,12 @@
 """Creates card database"""
 
-import sqlite3
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parents[1].resolve() / "src"))
+from card_database import connect, migrate # pylint: disable=wrong-import-position
+
 if __name__ == "__main__":
-    con = sqlite3.connect(Path(__file__).parents[1].resolve() / "src" / "cards.db")
-    cur = con.cursor()
-    cur.execute("CREATE TABLE IF NOT EXISTS 'cards'("\
-        "'name' TEXT NOT NULL, 'setCode' TEXT NOT NULL, 'collNo' INTEGER NOT NULL, "\
-        "'regMark' TEXT NOT NULL, 'type' TEXT NOT NULL, "\
-        "'isStandardLegal' BOOLEAN NOT NULL CHECK (isStandardLegal IN (0, 1)), "\
-        "'isExpandedLegal' BOOLEAN NOT NULL CHECK (isExpandedLegal IN (0, 1)))")
-    con.commit()
+    con = connect()
+    migrate(con)
     con.close()
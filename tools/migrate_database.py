@@ -0,0 +1,25 @@
+"""Upgrades an existing card database to the current schema in place"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1].resolve() / "src"))
+from card_database import DATABASE_PATH, SCHEMA_VERSION, connect, migrate # pylint: disable=wrong-import-position
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("database", nargs="?", default=DATABASE_PATH, type=Path,
+                        help="path to cards.db (default: %(default)s)")
+    parser.add_argument("--to", type=int, default=SCHEMA_VERSION,
+                        help="schema version to upgrade to (default: %(default)s)")
+    args = parser.parse_args()
+    if not args.database.exists():
+        sys.exit(f"{args.database} does not exist, run initialize_database.py first")
+    con = connect(args.database)
+    start, end = migrate(con, args.to)
+    con.close()
+    if start == end:
+        print(f"{args.database} is already at schema v{end}")
+    else:
+        print(f"Upgraded {args.database} from schema v{start} to v{end}")
@@ -0,0 +1,71 @@
+"""Reports where a fresh worker spends its startup time, importing the site and warming it up
+
+Runs the import in a new interpreter with python -X importtime, so nothing is already loaded,
+then sums the time by top-level package and times each warmup step, with what it imported.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+SRC_PATH = Path(__file__).parents[1].resolve() / "src"
+# lines look like "import time:       self |  cumulative | <indent>module", in microseconds
+IMPORT_TIME_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+\d+ \| \s*(\S+)")
+# written to stderr between importing the app and warming it up
+WARMUP_MARKER = "-- warmup --"
+STARTUP_SCRIPT = "import time\n"\
+                 "started = time.perf_counter()\n"\
+                 "import {app}\n"\
+                 "imported = time.perf_counter() - started\n"\
+                 "import json, sys, warmup\n"\
+                 f"print({WARMUP_MARKER!r}, file=sys.stderr, flush=True)\n"\
+                 "timings = warmup.warmup() if {warm} else {{}}\n"\
+                 "print(json.dumps({{'import': imported, 'warmup': timings}}))\n"
+
+def run_startup(app, warm):
+    """imports the app in a new interpreter, returns its import times and startup timings"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [str(SRC_PATH), os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             STARTUP_SCRIPT.format(app=app, warm=warm)],
+                            cwd=SRC_PATH, env=env, capture_output=True, text=True, check=False)
+    if result.returncode:
+        sys.exit(f"Starting {app} failed:\n{result.stderr}")
+    return result.stderr, json.loads(result.stdout.splitlines()[-1])
+
+def import_times(stderr):
+    """sums the time spent importing each top-level package, in seconds"""
+    packages = defaultdict(float)
+    for match in IMPORT_TIME_PATTERN.finditer(stderr):
+        self_time, module = match.groups()
+        packages[module.split(".")[0]] += int(self_time) / 1e6
+    return packages
+
+def print_packages(packages, top):
+    """prints the packages that took longest to import, slowest first"""
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<26}{seconds * 1000:>9.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--app", default="wsgi", choices=["wsgi", "asgi"],
+                        help="module the server imports (default: %(default)s)")
+    parser.add_argument("--no-warmup", action="store_true", help="only time the import")
+    parser.add_argument("--top", type=int, default=15,
+                        help="number of packages to list (default: %(default)s)")
+    args = parser.parse_args()
+    startup_stderr, timings = run_startup(args.app, not args.no_warmup)
+    import_stderr, _, warmup_stderr = startup_stderr.partition(WARMUP_MARKER)
+    print(f"{'import ' + args.app:<28}{timings['import'] * 1000:>9.1f} ms")
+    print_packages(import_times(import_stderr), args.top)
+    if timings["warmup"]:
+        print(f"{'warmup':<28}{sum(timings['warmup'].values()) * 1000:>9.1f} ms")
+        for step, seconds in timings["warmup"].items():
+            print(f"  {step:<26}{seconds * 1000:>9.1f} ms")
+        print("imported while warming up")
+        print_packages(import_times(warmup_stderr), args.top)